@@ -28,7 +28,7 @@ Edt   Subject       [Subject]               #subject      ?SUBJECT
 ---
 
 Box  border=1
-Edt  [Content]     #content &edit=changeContent multiline=True
+Doc  [Content]     #content &edit=changeContent height=12
 End
 
 ===
@@ -54,9 +54,8 @@ class Handler(urwide.Handler):
     def onSend(self, button):
         self.ui.info("Send")
 
-    def onChangeContent(self, widget, oldtext, newtext):
-        if oldtext != newtext:
-            self.ui.info("Email content changed !")
+    def onChangeContent(self, widget, deltas):
+        self.ui.info("Email content changed !")
 
     def exit(self):
         sys.exit()
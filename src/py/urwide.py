@@ -10,8 +10,10 @@
 # Last mod  : 15-12-2016
 # -----------------------------------------------------------------------------
 
-import sys, string, re, curses
-import urwid, urwid.raw_display, urwid.curses_display
+import sys, string, re, io, html, time, heapq, json, weakref, functools, collections
+import os, asyncio, base64, hashlib, struct, queue, threading
+import mmap, array, bisect, copy
+import urwid, urwid.raw_display
 from urwid.widget import (
     FLOW,
     FIXED,
@@ -68,56 +70,156 @@ COLORS = {
 RIGHT = "right"
 LEFT = "left"
 CENTER = "center"
+ENCODING = "utf8"
 
 
-def ensureString(t, encoding="utf8") -> str:
-    return t if isinstance(t, str) else str(t, encoding)
+def ensureString(t, encoding=None) -> str:
+    return t if isinstance(t, str) else str(t, encoding or ENCODING)
+
+
+def setEncoding(encoding):
+    """Sets the encoding of the text and of the terminal, which changes how
+    URWID measures and displays text (see 'Metrics')."""
+    global ENCODING
+    ENCODING = encoding
+    urwid.set_encoding(encoding)
+    METRICS.clear()
 
 
 def add_widget(container, widget, options=None):
-    w = widget
-    if isinstance(container, urwid.Pile):
-        # See: urwid.container.py Pile.__init__
-        w = widget
+    extend_contents(container, [widget])
+
+
+def remove_widgets(container):
+    replace_contents(container, [])
+
+
+def container_contents(container):
+    """Returns the list holding the children of the given container, which is
+    the 'contents' of a 'Pile', 'Columns' or 'GridFlow', and the body of a
+    'ListBox' (which must be a list walker)."""
+    if isinstance(container, urwid.ListBox):
+        if not isinstance(container.body, list):
+            raise UIRuntimeError("List box body is not a list: " + repr(container.body))
+        return container.body
+    else:
+        return container.contents
+
+
+def content_items(container, widgets):
+    """Returns the given widgets as items of the contents of the given
+    container. Like in the UI description, widgets of a 'Pile' or 'Columns'
+    can be given with their options as '(FLOW, widget)', '(height, widget)',
+    '(FIXED, height, widget)' or '(WEIGHT, weight, widget)', and items that
+    are already '(widget, options)' (with an options tuple) are kept as
+    they are."""
+    widgets = list(widgets)
+    if isinstance(container, urwid.ListBox):
+        return widgets
+    default = container.options()
+    if not any(isinstance(_, tuple) for _ in widgets):
+        return [(_, default) for _ in widgets]
+    options = container.options
+    res = []
+    for w in widgets:
         if not isinstance(w, tuple):
-            container.contents.append((w, (WEIGHT, 1)))
+            res.append((w, default))
+        elif len(w) == 2 and isinstance(w[1], tuple):
+            res.append(w)
         elif w[0] in (FLOW, PACK):
-            f, w = w
-            container.contents.append((w, (PACK, None)))
+            res.append((w[1], options(PACK)))
         elif len(w) == 2:
-            height, w = w
-            container.contents.append((w, (GIVEN, height)))
+            res.append((w[1], options(GIVEN, w[0])))
         elif w[0] == FIXED:  # backwards compatibility
-            _ignore, height, w = w
-            container.contents.append((w, (GIVEN, height)))
+            res.append((w[2], options(GIVEN, w[1])))
         elif w[0] == WEIGHT:
-            f, height, w = w
-            container.contents.append((w, (f, height)))
+            res.append((w[2], options(WEIGHT, w[1])))
         else:
-            raise ValueError("Widget not as expected: {0}".format(widget))
-    else:
-        container.contents.append(widget)
+            raise ValueError("Widget not as expected: {0}".format(w))
+    return res
 
 
-def remove_widgets(container):
-    w = [_ for _ in container.contents]
-    for _ in w:
-        container.contents.remove(_)
+def splice_contents(container, start, end, widgets=()):
+    """Replaces the children of the given container from 'start' to 'end'
+    by the given widgets (see 'content_items'), in a single assignment, so
+    that the container is only notified (and invalidated) once."""
+    container_contents(container)[start:end] = content_items(container, widgets)
+
+
+def replace_contents(container, widgets):
+    """Replaces all the children of the given container by the given
+    widgets (see 'splice_contents')."""
+    splice_contents(container, 0, None, widgets)
+
+
+def extend_contents(container, widgets):
+    """Appends the given widgets to the children of the given container (see
+    'splice_contents')."""
+    container_contents(container).extend(content_items(container, widgets))
 
 
 def original_widgets(widget):
-    if widget:
-        stack = [widget]
-        if len(stack) > 0:
-            while hasattr(stack[0], "original_widget"):
-                original = stack[0].original_widget
-                if original not in stack:
-                    stack.insert(0, original)
-                else:
-                    break
-        return stack
-    else:
+    """Returns the chain of 'original_widget' of the given widget, the
+    deepest first and the widget itself last."""
+    if not widget:
         return []
+    stack = [widget]
+    seen = {id(widget)}
+    while hasattr(widget, "original_widget"):
+        widget = widget.original_widget
+        if id(widget) in seen:
+            break
+        seen.add(id(widget))
+        stack.append(widget)
+    stack.reverse()
+    return stack
+
+
+def compose_attributes(inner, outer):
+    """Returns the attribute map that gives the same result as applying the
+    'inner' attribute map and then the 'outer' one."""
+    res = dict((k, outer.get(v, v)) for k, v in inner.items())
+    for k, v in outer.items():
+        res.setdefault(k, v)
+    return res
+
+
+def attribute_maps(wrapper):
+    """Returns the '(attr_map, focus_map)' the given attribute wrapper applies
+    when unfocused and focused."""
+    focus_map = wrapper.focus_map
+    return wrapper.attr_map, wrapper.attr_map if focus_map is None else focus_map
+
+
+def merge_attributes(wrapper, attr, focus_attr=None):
+    """Merges the attributes of an `urwid.AttrWrap(wrapper, attr, focus_attr)`
+    into the given attribute wrapper, which then renders the same with one
+    wrapper (and one canvas composition) less. Returns the wrapper."""
+    attr_map, focus_map = attribute_maps(wrapper)
+    outer = {None: attr}
+    attr_map = compose_attributes(attr_map, outer)
+    focus_map = compose_attributes(focus_map, {None: focus_attr} if focus_attr else outer)
+    wrapper.set_attr_map(attr_map)
+    wrapper.set_focus_map(None if focus_map == attr_map else focus_map)
+    return wrapper
+
+
+def fold_attributes(wrapper):
+    """Removes the attribute wrapper found right below the 'Padding' of the
+    given attribute wrapper when the latter maps the attributes the same
+    way, with or without it. Returns the given wrapper."""
+    padding = wrapper.original_widget
+    if type(padding) is not urwid.Padding:
+        return wrapper
+    inner = padding.original_widget
+    if type(inner) not in ATTRIBUTE_WRAPPERS:
+        return wrapper
+    outer_maps = attribute_maps(wrapper)
+    if all(
+        compose_attributes(a, b) == b for a, b in zip(attribute_maps(inner), outer_maps)
+    ):
+        padding.original_widget = inner.original_widget
+    return wrapper
 
 
 def original_widget(widget):
@@ -133,6 +235,1550 @@ def original_focus(widget):
     return w[0]
 
 
+def focused_widget(widget):
+    """Returns the deepest focused widget within the given widget."""
+    # We get the original widget to focus on
+    focused = original_widget(widget)
+    old_focused = None
+    while focused != old_focused:
+        old_focused = focused
+        # There are some types that are not focuable
+        if isinstance(focused, urwid.AttrWrap):
+            if focused.w:
+                focused = focused.w
+        elif isinstance(focused, urwid.Padding):
+            if focused.min_width:
+                focused = focused.min_width
+        elif isinstance(focused, urwid.Filler):
+            if focused.w:
+                focused = focused.w
+        elif hasattr(focused, "get_focus"):
+            if focused.get_focus():
+                focused = focused.get_focus()
+    return focused
+
+
+def widget_size(widget):
+    """Returns the number of widgets in the subtree of the given widget and
+    an estimate of their size in bytes (the widgets and their '__dict__')."""
+    count = size = 0
+    seen = set()
+    stack = [widget]
+    while stack:
+        widget = stack.pop()
+        if id(widget) in seen:
+            continue
+        seen.add(id(widget))
+        count += 1
+        size += sys.getsizeof(widget)
+        if hasattr(widget, "__dict__"):
+            size += sys.getsizeof(widget.__dict__)
+        if widget in METADATA:
+            size += sys.getsizeof(METADATA[widget])
+        stack.extend(widget_children(widget))
+    return count, size
+
+
+def widget_children(widget):
+    """Returns the list of direct children of the given widget, which is
+    empty for widgets that are not containers or decorations."""
+    if isinstance(widget, urwid.ListBox):
+        body = widget.body
+        return list(body) if isinstance(body, list) else []
+    elif isinstance(widget, urwid.Frame):
+        return [_ for _ in (widget.header, widget.body, widget.footer) if _]
+    elif isinstance(widget, DeferredWidget):
+        return [widget.original_widget] if widget.isBuilt() else []
+    elif isinstance(widget, urwid.WidgetDecoration):
+        return [widget.original_widget]
+    elif isinstance(widget, (urwid.Pile, urwid.Columns, urwid.GridFlow)):
+        return [_[0] for _ in widget.contents]
+    else:
+        return []
+
+
+def text_markup(text, attributes):
+    """Returns the markup of the given text and its '(attribute, length)'
+    runs, as returned by 'urwid.Text.get_text'."""
+    if not attributes:
+        return text
+    res = []
+    offset = 0
+    for attr, length in attributes:
+        res.append((attr, text[offset : offset + length]))
+        offset += length
+    if offset < len(text):
+        res.append(text[offset:])
+    return res
+
+
+def is_immutable(value):
+    """Tells if the given value is made only of immutable values, so that it
+    can be shared."""
+    if isinstance(value, (tuple, frozenset)):
+        return all(is_immutable(_) for _ in value)
+    return value is None or isinstance(value, (str, bytes, int, float, complex))
+
+
+class WidgetMeta:
+    """The URWIDE metadata of a widget: its 'id', its 'info' and 'tooltip',
+    and its event handlers. The records are kept in the 'METADATA' side
+    table rather than as attributes of the widgets, as a slotted record
+    takes less memory than the keys it would add to the '__dict__' of each
+    widget."""
+
+    __slots__ = ("id", "info", "tooltip", "onKey", "onFocus", "onEdit", "onPress")
+    HANDLERS = ("onKey", "onFocus", "onEdit", "onPress")
+
+    def __init__(self):
+        for _ in self.__slots__:
+            setattr(self, _, None)
+
+
+# The metadata of the widgets, which goes away with them
+METADATA = weakref.WeakKeyDictionary()
+
+
+def widget_meta(widget, name):
+    """Returns the metadata 'name' of the given widget (see 'WidgetMeta'),
+    or 'None' when it has none."""
+    try:
+        meta = METADATA.get(widget)
+    except TypeError:
+        # Not a widget (nor weakly referenceable)
+        return None
+    return None if meta is None else getattr(meta, name)
+
+
+def set_widget_meta(widget, name, value):
+    """Sets the metadata 'name' of the given widget (see 'WidgetMeta')."""
+    meta = METADATA.get(widget)
+    if meta is None:
+        meta = METADATA[widget] = WidgetMeta()
+    setattr(meta, name, value)
+
+
+# ------------------------------------------------------------------------------
+#
+# STATISTICS
+#
+# ------------------------------------------------------------------------------
+
+
+class Stats:
+    """Collects named counters for a UI, such as the number of canvases
+    that were served from a cache ('NAME.hit') or rendered ('NAME.miss').
+    Hit rates are derived from these pairs in the 'report'.
+
+    Stats also keep the last 'SAMPLES' samples of named values, such as the
+    frame times, from which distributions are computed."""
+
+    SAMPLES = 10000
+
+    def __init__(self):
+        self.counters = {}
+        self.samples = {}
+
+    def count(self, name, value=1):
+        """Increments the counter with the given 'name' by 'value'."""
+        self.counters[name] = self.counters.get(name, 0) + value
+
+    def get(self, name):
+        """Returns the value of the given counter, '0' if not set."""
+        return self.counters.get(name, 0)
+
+    def sample(self, name, value):
+        """Adds a sample of the given value (eg. a duration in seconds)."""
+        samples = self.samples.get(name)
+        if samples is None:
+            samples = self.samples[name] = collections.deque(maxlen=self.SAMPLES)
+        samples.append(value)
+
+    def distribution(self, name):
+        """Returns the distribution of the samples of the given name as a
+        dict with 'count', 'min', 'mean', 'p50', 'p90', 'p99' and 'max'."""
+        samples = sorted(self.samples.get(name, ()))
+        n = len(samples)
+        if not n:
+            return {"count": 0}
+        return {
+            "count": n,
+            "min": samples[0],
+            "mean": sum(samples) / n,
+            "p50": samples[int(n * 0.50)],
+            "p90": samples[min(n - 1, int(n * 0.90))],
+            "p99": samples[min(n - 1, int(n * 0.99))],
+            "max": samples[-1],
+        }
+
+    def rate(self, name):
+        """Returns the hit rate (between '0' and '1') for the 'NAME.hit' and
+        'NAME.miss' counters."""
+        hits = self.get(name + ".hit")
+        total = hits + self.get(name + ".miss")
+        return float(hits) / total if total else 0.0
+
+    def reset(self):
+        """Resets all the counters and samples."""
+        self.counters = {}
+        self.samples = {}
+
+    def report(self):
+        """Returns a dict with all the counters and the derived hit rates
+        (as 'NAME.rate')."""
+        res = dict(self.counters)
+        for name in self.counters:
+            if name.endswith(".hit"):
+                name = name[:-4]
+                res[name + ".rate"] = self.rate(name)
+        return res
+
+    def __str__(self):
+        return " ".join(
+            "%s=%.0f%%" % (k, v * 100) if k.endswith(".rate") else "%s=%s" % (k, v)
+            for k, v in sorted(self.report().items())
+        )
+
+
+# ------------------------------------------------------------------------------
+#
+# TEXT METRICS
+#
+# ------------------------------------------------------------------------------
+
+
+class Metrics:
+    """Measures the display width and the wrapped height of text using
+    URWID's width tables, so that East Asian wide characters take two cells.
+    Measures are memoized per string, use the 'METRICS' instance."""
+
+    CACHE_SIZE = 4096
+
+    def __init__(self):
+        self.width = functools.lru_cache(self.CACHE_SIZE)(self._width)
+        self.height = functools.lru_cache(self.CACHE_SIZE)(self._height)
+
+    def clear(self):
+        """Clears the memoized measures, which is required when the encoding
+        changes."""
+        self.width.cache_clear()
+        self.height.cache_clear()
+
+    def _width(self, text):
+        """Returns the number of cells required to display the widest line
+        of the given text."""
+        return max(urwid.calc_width(_, 0, len(_)) for _ in text.split("\n"))
+
+    def _height(self, text, width):
+        """Returns the number of rows the given text takes when wrapped to
+        the given width."""
+        return len(urwid.default_layout.layout(text, max(width, 1), LEFT, "space"))
+
+    def text(self, widget):
+        """Returns the text displayed by the given widget (the label for
+        buttons), or 'None'."""
+        widget = self.base(widget)
+        if isinstance(widget, (urwid.Button, urwid.CheckBox)):
+            return widget.get_label()
+        elif isinstance(widget, urwid.Text):
+            return widget.text
+        else:
+            return None
+
+    def base(self, widget):
+        """Returns the widget decorated by attribute wrappers and caches."""
+        while isinstance(widget, (urwid.AttrMap, CachedWidget)):
+            widget = widget.original_widget
+        return widget
+
+    def rows(self, widget, width):
+        """Returns the number of rows the given flow widget takes for the
+        given width, computed from the text measures instead of rendering."""
+        widget = self.base(widget)
+        if isinstance(widget, urwid.Divider):
+            return widget.top + 1 + widget.bottom
+        elif isinstance(widget, (urwid.Button, urwid.CheckBox)):
+            return self.height(widget.get_label(), width - 4)
+        elif isinstance(widget, urwid.Text) and widget.wrap == "space":
+            return self.height(widget.text, width)
+        elif isinstance(widget, urwid.Text):
+            return widget.text.count("\n") + 1
+        elif isinstance(widget, urwid.Padding):
+            left, right = widget.padding_values((width,), False)
+            return self.rows(widget.original_widget, width - left - right)
+        elif isinstance(widget, urwid.Pile):
+            return sum(self.rows(_, width) for _ in widget_children(widget))
+        elif isinstance(widget, urwid.GridFlow):
+            cells = widget_children(widget)
+            per_row = max(1, (width + widget.h_sep) // (widget.cell_width + widget.h_sep))
+            res = 0
+            for i in range(0, len(cells), per_row):
+                res += max(self.rows(_, widget.cell_width) for _ in cells[i : i + per_row])
+            return res + widget.v_sep * max(0, (len(cells) - 1) // per_row)
+        else:
+            return widget.rows((width,))
+
+
+METRICS = Metrics()
+
+# ------------------------------------------------------------------------------
+#
+# SNAPSHOTS
+#
+# ------------------------------------------------------------------------------
+
+# Maps the URWID color names to CSS colors and ANSI SGR codes
+CSS_COLORS = {
+    "black": "#000000",
+    "dark red": "#800000",
+    "dark green": "#008000",
+    "brown": "#808000",
+    "dark blue": "#000080",
+    "dark magenta": "#800080",
+    "dark cyan": "#008080",
+    "light gray": "#c0c0c0",
+    "dark gray": "#808080",
+    "light red": "#ff0000",
+    "light green": "#00ff00",
+    "yellow": "#ffff00",
+    "light blue": "#0000ff",
+    "light magenta": "#ff00ff",
+    "light cyan": "#00ffff",
+    "white": "#ffffff",
+}
+ANSI_COLORS = {
+    "black": 30,
+    "dark red": 31,
+    "dark green": 32,
+    "brown": 33,
+    "dark blue": 34,
+    "dark magenta": 35,
+    "dark cyan": 36,
+    "light gray": 37,
+    "dark gray": 90,
+    "light red": 91,
+    "light green": 92,
+    "yellow": 93,
+    "light blue": 94,
+    "light magenta": 95,
+    "light cyan": 96,
+    "white": 97,
+}
+ANSI_FONTS = {"bold": 1, "underline": 4, "standout": 7}
+
+
+class Snapshot:
+    """Renders URWID canvases as plain text, one line per row. Subclasses
+    render them as HTML ('HTMLSnapshot') or ANSI escapes ('ANSISnapshot')
+    using the palette of the UI (see 'UI.parseStyle').
+
+    Rows are rendered as runs of text with the same attribute, which are
+    merged, and streamed row by row by 'render'."""
+
+    def __init__(self, palette=None):
+        self.palette = dict((_[0], _[1:]) for _ in (palette or ()))
+        self._attrs = {}
+
+    def runs(self, row):
+        """Returns the given canvas row (as given by 'canvas.content()') as a
+        list of '[attr, text]' where consecutive runs with the same attribute
+        are merged."""
+        res = []
+        for attr, cs, text in row:
+            text = text.decode(ENCODING, "replace")
+            if res and res[-1][0] == attr:
+                res[-1][1] += text
+            else:
+                res.append([attr, text])
+        return res
+
+    def attr(self, attr):
+        """Returns the (cached) opening text for the given attribute."""
+        res = self._attrs.get(attr)
+        if res is None:
+            res = self._attrs[attr] = self.open(attr)
+        return res
+
+    def open(self, attr):
+        return ""
+
+    def header(self):
+        return ""
+
+    def row(self, runs):
+        return "".join(_[1] for _ in runs) + "\n"
+
+    def footer(self):
+        return ""
+
+    def render(self, canvas):
+        """Yields the rendering of the given canvas, row by row."""
+        yield self.header()
+        for row in canvas.content():
+            yield self.row(self.runs(row))
+        yield self.footer()
+
+
+class ANSISnapshot(Snapshot):
+    """Renders canvases with ANSI (SGR) escape sequences."""
+
+    RESET = "\x1b[0m"
+
+    def open(self, attr):
+        fg, bg, font = self.palette.get(attr, ("default", "default", "default"))
+        codes = [0]
+        if fg in ANSI_COLORS:
+            codes.append(ANSI_COLORS[fg])
+        if bg in ANSI_COLORS:
+            codes.append(ANSI_COLORS[bg] + 10)
+        if font in ANSI_FONTS:
+            codes.append(ANSI_FONTS[font])
+        return "\x1b[%sm" % (";".join(str(_) for _ in codes))
+
+    def row(self, runs):
+        return "".join(self.attr(_[0]) + _[1] for _ in runs) + self.RESET + "\n"
+
+
+class HTMLSnapshot(Snapshot):
+    """Renders canvases as an HTML '<pre>' element, where each run of text is
+    a '<span>' with the CSS class of its attribute (see 'css')."""
+
+    RE_CLASS = re.compile("[^\\w\\-]")
+
+    def className(self, attr):
+        if type(attr) in (str,):
+            return "a-" + self.RE_CLASS.sub("_", attr.replace("*", "-focus"))
+        else:
+            return "a"
+
+    def css(self):
+        """Returns the CSS stylesheet corresponding to the palette."""
+        res = [
+            ".urwide {background:#000000;color:#c0c0c0;line-height:1.2;font-family:monospace}"
+        ]
+        for name, (fg, bg, font) in self.palette.items():
+            fg, bg = CSS_COLORS.get(fg), CSS_COLORS.get(bg)
+            if font == "standout":
+                fg, bg = bg or "#000000", fg or "#c0c0c0"
+            style = []
+            if fg:
+                style.append("color:" + fg)
+            if bg:
+                style.append("background:" + bg)
+            if font == "bold":
+                style.append("font-weight:bold")
+            if font == "underline":
+                style.append("text-decoration:underline")
+            res.append(".urwide .%s {%s}" % (self.className(name), ";".join(style)))
+        return "\n".join(res)
+
+    def open(self, attr):
+        return '<span class="%s">' % (self.className(attr))
+
+    def header(self):
+        return '<pre class="urwide">'
+
+    def row(self, runs):
+        return (
+            "".join(self.attr(_[0]) + html.escape(_[1], False) + "</span>" for _ in runs)
+            + "\n"
+        )
+
+    def footer(self):
+        return "</pre>\n"
+
+
+SNAPSHOTS = {"text": Snapshot, "ansi": ANSISnapshot, "html": HTMLSnapshot}
+
+# The wrappers that only apply attributes, which can be merged together (see
+# 'merge_attributes')
+ATTRIBUTE_WRAPPERS = (urwid.AttrWrap, urwid.AttrMap)
+
+# ------------------------------------------------------------------------------
+#
+# STATIC WIDGETS
+#
+# ------------------------------------------------------------------------------
+
+
+class SizeCache(collections.OrderedDict):
+    """An ordered dict that only keeps its 'limit' most recently used
+    entries, which holds the canvases of the last few sizes a widget (or the
+    screen) had, so that going back to one of them reuses its layout (and
+    the parsed UI attributes, see 'UI.ATTRIBUTES')."""
+
+    def __init__(self, limit):
+        super().__init__()
+        self.limit = limit
+
+    def get(self, key, default=None):
+        if key not in self:
+            return default
+        self.move_to_end(key)
+        return self[key]
+
+    def put(self, key, value):
+        self[key] = value
+        self.move_to_end(key)
+        while len(self) > self.limit:
+            self.popitem(last=False)
+        return value
+
+
+class CanvasWidget(urwid.Widget):
+    """A box widget that displays a canvas that was rendered beforehand, such
+    as the layers below the top dialog (see 'Console.render')."""
+
+    _sizing = frozenset([BOX])
+    ignore_focus = True
+
+    def __init__(self, canvas=None):
+        super().__init__()
+        self._canvas = canvas
+
+    @staticmethod
+    def isCached(widget, size, canvas, focus=False):
+        """Tells if the given canvas is still the one URWID has cached for
+        the given widget, which is not the case anymore once the widget or
+        any of its descendants has been invalidated (which includes focus
+        changes)."""
+        cls = next(_ for _ in type(widget).__mro__ if "render" in _.__dict__)
+        return urwid.CanvasCache.fetch(widget, cls, size, focus) is canvas
+
+    def setCanvas(self, canvas):
+        self._canvas = canvas
+        self._invalidate()
+
+    def render(self, size, focus=False):
+        return urwid.CompositeCanvas(self._canvas)
+
+
+class CachedWidget(urwid.WidgetDecoration):
+    """Decorates a static widget (a subtree with no id, no events and no
+    bindings, see 'UI._isStatic') so that its canvases are kept for the last
+    'SIZES' (size, focus) and reused until 'invalidate' is called."""
+
+    SIZES = 8
+
+    def __init__(self, widget, stats=None):
+        super().__init__(widget)
+        self._canvases = SizeCache(self.SIZES)
+        self._stats = stats
+
+    def __getattr__(self, name):
+        # Like 'urwid.AttrWrap', we forward public attributes (eg. 'get_text')
+        # to the decorated widget.
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return getattr(self._original_widget, name)
+
+    def invalidate(self):
+        """Clears the cached canvases."""
+        self._canvases = SizeCache(self.SIZES)
+        self._invalidate()
+
+    def sizing(self):
+        return self._original_widget.sizing()
+
+    def selectable(self):
+        return self._original_widget.selectable()
+
+    def rows(self, size, focus=False):
+        return self._original_widget.rows(size, focus)
+
+    def pack(self, size=None, focus=False):
+        return self._original_widget.pack(size, focus)
+
+    def render(self, size, focus=False):
+        key = (size, focus)
+        canvas = self._canvases.get(key)
+        if canvas is None:
+            canvas = self._canvases.put(key, self._original_widget.render(size, focus))
+            if self._stats:
+                self._stats.count("static.miss")
+        elif self._stats:
+            self._stats.count("static.hit")
+        return canvas
+
+
+class DeferredWidget(urwid.WidgetPlaceholder):
+    """Stands for a container whose lines are only parsed when it is first
+    needed (see 'UI._defer'), that is when it is rendered, measured or
+    focused, or when an id is looked up. A long list box thus only builds
+    the containers that are scrolled into view."""
+
+    def __init__(self, build):
+        urwid.Widget.__init__(self)
+        self._build = build
+        self._widget = None
+
+    @property
+    def _original_widget(self):
+        if self._widget is None:
+            self._widget, self._build = self._build(), None
+        return self._widget
+
+    @_original_widget.setter
+    def _original_widget(self, widget):
+        self._widget, self._build = widget, None
+
+    def isBuilt(self):
+        return self._widget is not None
+
+    def _repr_words(self):
+        words = urwid.Widget._repr_words(self)
+        return words + [repr(self._widget) if self._widget else "deferred"]
+
+
+# ------------------------------------------------------------------------------
+#
+# DOCUMENT EDITOR
+#
+# ------------------------------------------------------------------------------
+
+
+def layout_row(text, maxcol):
+    """Returns the '(bytes, charsets)' of the row that displays the given
+    text, clipped or padded to 'maxcol' columns, for an 'urwid.TextCanvas'."""
+    end, width = urwid.util.calc_text_pos(text, 0, len(text), maxcol)
+    return urwid.apply_target_encoding(text[:end] + " " * (maxcol - width))
+
+
+class GapBuffer:
+    """The lines of a document, with a gap at the edit point: the lines
+    before the gap are kept in order in 'head' and the lines after it in
+    reverse order in 'tail', so that editing lines at the gap does not move
+    the rest of the document. Moving the gap costs in proportion to the
+    distance, and edits mostly happen where the previous one did."""
+
+    def __init__(self, text=""):
+        self.head = text.split("\n")
+        self.tail = []
+
+    def __len__(self):
+        return len(self.head) + len(self.tail)
+
+    def line(self, i):
+        """Returns the line at the given index."""
+        head = self.head
+        if i < len(head):
+            return head[i]
+        else:
+            return self.tail[len(head) - 1 - i]
+
+    def text(self):
+        """Returns the whole document as a string."""
+        return "\n".join(self.head + self.tail[::-1])
+
+    def moveGap(self, i):
+        """Moves the gap right before the line at the given index."""
+        head, tail = self.head, self.tail
+        if i < len(head):
+            moved = head[i:]
+            del head[i:]
+            moved.reverse()
+            tail.extend(moved)
+        elif i > len(head):
+            moved = tail[len(head) - i :]
+            del tail[len(head) - i :]
+            moved.reverse()
+            head.extend(moved)
+
+    def insert(self, line, col, text):
+        """Inserts the given text at the given position, and returns the
+        position of the end of the inserted text."""
+        self.moveGap(line + 1)
+        head = self.head
+        current = head.pop()
+        parts = text.split("\n")
+        if len(parts) == 1:
+            head.append(current[:col] + text + current[col:])
+            return (line, col + len(text))
+        head.append(current[:col] + parts[0])
+        head.extend(parts[1:-1])
+        head.append(parts[-1] + current[col:])
+        return (line + len(parts) - 1, len(parts[-1]))
+
+    def delete(self, line, col, end_line, end_col):
+        """Deletes the text between the given positions and returns it."""
+        self.moveGap(end_line + 1)
+        head = self.head
+        lines = head[line:]
+        del head[line:]
+        head.append(lines[0][:col] + lines[-1][end_col:])
+        lines[-1] = lines[-1][:end_col]
+        lines[0] = lines[0][col:]
+        return "\n".join(lines)
+
+
+class DocEdit(urwid.Widget):
+    """A multiline editor for large documents, backed by a 'GapBuffer'. Only
+    the visible lines are laid out (one row per line, scrolled horizontally
+    with the cursor), and the keyboard edits are recorded as deltas
+    '(line, col, removed, inserted)' instead of copies of the text (see
+    'deltas'). Being a box widget, it is given a height in a list box (see
+    'UI._parseDoc')."""
+
+    _sizing = frozenset([BOX])
+    _selectable = True
+
+    def __init__(self, text=""):
+        super().__init__()
+        self.buffer = GapBuffer(text)
+        self.cursor = (0, 0)
+        self.top = 0
+        self.left = 0
+        self._column = None
+        self._layout = {}
+        self._layoutKey = None
+        self._deltas = []
+
+    def get_text(self):
+        return self.buffer.text()
+
+    def set_text(self, text):
+        """Replaces the document, which is not recorded as a delta."""
+        self.buffer = GapBuffer(text)
+        self.cursor = (0, 0)
+        self.top = self.left = 0
+        self._layout = {}
+        self._invalidate()
+
+    def insert(self, line, col, text):
+        """Inserts the given text at the given position."""
+        end = self.buffer.insert(line, col, text)
+        self._changed(line, "\n" in text)
+        return end
+
+    def delete(self, line, col, end_line, end_col):
+        """Deletes the text between the given positions, and returns it."""
+        text = self.buffer.delete(line, col, end_line, end_col)
+        self._changed(line, end_line != line)
+        return text
+
+    def deltas(self):
+        """Returns the deltas '(line, col, removed, inserted)' of the
+        keyboard edits since the last call, in order."""
+        res, self._deltas = self._deltas, []
+        return res
+
+    def _changed(self, line, lines):
+        """Drops the layout of the given line, or of all the lines from it
+        when 'lines' tells that lines were added or removed."""
+        layout = self._layout
+        for _ in [_ for _ in layout if _ == line or (lines and _ > line)]:
+            del layout[_]
+        self._invalidate()
+
+    def _edit(self, line, col, end_line, end_col, text):
+        removed = ""
+        if (line, col) != (end_line, end_col):
+            removed = self.delete(line, col, end_line, end_col)
+        self.cursor = self.insert(line, col, text) if text else (line, col)
+        self._column = None
+        self._deltas.append((line, col, removed, text))
+
+    def _move(self, line, col, keep_column=False):
+        line = max(0, min(line, len(self.buffer) - 1))
+        if keep_column:
+            self._column = col if self._column is None else self._column
+            col = self._column
+        else:
+            self._column = None
+        self.cursor = (line, min(col, len(self.buffer.line(line))))
+        self._invalidate()
+
+    def keypress(self, size, key):
+        (maxcol, maxrow) = size
+        line, col = self.cursor
+        length = len(self.buffer.line(line))
+        if len(key) == 1 and key.isprintable():
+            self._edit(line, col, line, col, key)
+        elif key == "enter":
+            self._edit(line, col, line, col, "\n")
+        elif key == "backspace":
+            if col > 0:
+                self._edit(line, col - 1, line, col, "")
+            elif line > 0:
+                previous = len(self.buffer.line(line - 1))
+                self._edit(line - 1, previous, line, 0, "")
+        elif key == "delete":
+            if col < length:
+                self._edit(line, col, line, col + 1, "")
+            elif line < len(self.buffer) - 1:
+                self._edit(line, col, line + 1, 0, "")
+        elif key == "left" and (col > 0 or line > 0):
+            if col > 0:
+                self._move(line, col - 1)
+            else:
+                self._move(line - 1, len(self.buffer.line(line - 1)))
+        elif key == "right" and (col < length or line < len(self.buffer) - 1):
+            if col < length:
+                self._move(line, col + 1)
+            else:
+                self._move(line + 1, 0)
+        elif key == "up" and line > 0:
+            self._move(line - 1, col, True)
+        elif key == "down" and line < len(self.buffer) - 1:
+            self._move(line + 1, col, True)
+        elif key == "page up" and line > 0:
+            self.top = max(0, self.top - maxrow + 1)
+            self._move(line - maxrow + 1, col, True)
+        elif key == "page down" and line < len(self.buffer) - 1:
+            self.top = min(self.top + maxrow - 1, len(self.buffer) - 1)
+            self._move(line + maxrow - 1, col, True)
+        elif key == "home":
+            self._move(line, 0)
+        elif key == "end":
+            self._move(line, length)
+        elif key == "ctrl home":
+            self._move(0, 0)
+        elif key == "ctrl end":
+            last = len(self.buffer) - 1
+            self._move(last, len(self.buffer.line(last)))
+        else:
+            return key
+        return None
+
+    def get_cursor_coords(self, size):
+        (maxcol, maxrow) = size
+        self._scroll(size)
+        line, col = self.cursor
+        text = self.buffer.line(line)
+        return (urwid.util.calc_width(text, self.left, col), line - self.top)
+
+    def _scroll(self, size):
+        """Scrolls so that the cursor is visible at the given size."""
+        (maxcol, maxrow) = size
+        line, col = self.cursor
+        self.top = max(min(self.top, line), line - maxrow + 1, 0)
+        if col < self.left:
+            self.left = max(0, col - maxcol // 2)
+        elif col - self.left >= maxcol:
+            self.left = col - maxcol // 2
+        # Wide characters take more than one column
+        text = self.buffer.line(line)
+        while self.left < col and urwid.util.calc_width(text, self.left, col) >= maxcol:
+            self.left += 1
+
+    def render(self, size, focus=False):
+        (maxcol, maxrow) = size
+        self._scroll(size)
+        # The layout of the visible lines is kept as long as the horizontal
+        # scroll and width do not change, the other lines are dropped.
+        key = (self.left, maxcol)
+        if key != self._layoutKey:
+            self._layoutKey = key
+            self._layout = {}
+        layout = self._layout
+        visible = range(self.top, min(self.top + maxrow, len(self.buffer)))
+        if len(layout) > maxrow:
+            self._layout = layout = dict((_, layout[_]) for _ in visible if _ in layout)
+        text = []
+        cs = []
+        for i in visible:
+            row = layout.get(i)
+            if row is None:
+                row = layout[i] = layout_row(self.buffer.line(i)[self.left :], maxcol)
+            text.append(row[0])
+            cs.append(row[1])
+        blank = b" " * maxcol
+        for _ in range(maxrow - len(text)):
+            text.append(blank)
+            cs.append([])
+        cursor = self.get_cursor_coords(size) if focus else None
+        return urwid.TextCanvas(text, cs=cs, cursor=cursor, maxcol=maxcol)
+
+
+# ------------------------------------------------------------------------------
+#
+# PAGER
+#
+# ------------------------------------------------------------------------------
+
+
+class Pager(urwid.Widget):
+    """A read-only view of a (possibly huge) file, which is memory-mapped
+    rather than read: only the visible lines are decoded (with 'ENCODING',
+    see 'setEncoding'), and the pages that were not viewed are not loaded.
+    The line numbers come from an index of the number of lines per block of
+    the file, which is built incrementally (see 'index') and only as far as
+    needed by 'goto' and 'line'. Being a box widget, it is given a height
+    in a list box (see 'UI._parsePgr')."""
+
+    _sizing = frozenset([BOX])
+    _selectable = True
+
+    # The size of the indexed blocks, which is a multiple of the page size
+    BLOCK = 64 * 1024
+    # The size of the windows that searches scan at once, and by which the
+    # pages are released (the kernel maps the pages around the accessed ones,
+    # up to the size of a huge page)
+    WINDOW = 32 * BLOCK
+
+    def __init__(self, path, encoding=None):
+        super().__init__()
+        self.path = path
+        self.encoding = encoding
+        self._file = open(path, "rb")
+        size = os.fstat(self._file.fileno()).st_size
+        # An empty file cannot be mapped
+        self.data = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if size else b""
+        self.size = size
+        self.offset = 0
+        self.left = 0
+        self._lines = array.array("Q", [0])
+        # The range of the file shown by the last render
+        self._visible = (0, 0)
+
+    def close(self):
+        """Unmaps and closes the file, after which the pager is empty. This
+        is done by 'UI.destroy' and 'UI.replace'."""
+        if self.data:
+            self.data.close()
+            self.data = b""
+        self.size = self.offset = 0
+        self._visible = (0, 0)
+        self._file.close()
+
+    # INDEX
+    # -------------------------------------------------------------------------
+
+    def isIndexed(self):
+        return (len(self._lines) - 1) * self.BLOCK >= self.size
+
+    def index(self, blocks=64):
+        """Indexes the given number of blocks, and tells if there are blocks
+        left to index. The pages of the indexed blocks are released, so
+        that the memory use follows what is viewed."""
+        data, lines, block = self.data, self._lines, self.BLOCK
+        for _ in range(blocks):
+            start = (len(lines) - 1) * block
+            if start >= self.size:
+                return False
+            lines.append(lines[-1] + data[start : start + block].count(b"\n"))
+            self._release(start, min(start + block, self.size))
+        return not self.isIndexed()
+
+    def _release(self, start, end):
+        """Releases the pages of the given range of the file, which are
+        loaded again when accessed, so that scanning the file does not
+        make it resident. The pages of the visible lines are kept."""
+        if end > start and hasattr(self.data, "madvise"):
+            start -= start % self.WINDOW
+            end = min(self.size, end + (-end) % self.WINDOW)
+            top, bottom = self._visible
+            top -= top % mmap.PAGESIZE
+            bottom += (-bottom) % mmap.PAGESIZE
+            for start, end in ((start, min(end, top)), (max(start, bottom), end)):
+                if end > start:
+                    self.data.madvise(mmap.MADV_DONTNEED, start, end - start)
+
+    def line(self, offset=None):
+        """Returns the number of the line at the given byte offset (the top
+        line by default), indexing the file up to there."""
+        offset = self.offset if offset is None else offset
+        block = offset // self.BLOCK
+        while len(self._lines) <= block and self.index():
+            pass
+        start = block * self.BLOCK
+        return self._lines[block] + self.data[start:offset].count(b"\n")
+
+    def offsetOf(self, line):
+        """Returns the byte offset of the given line, or 'None' when the
+        file has less lines."""
+        lines = self._lines
+        while lines[-1] <= line and self.index():
+            pass
+        block = bisect.bisect_right(lines, line) - 1
+        # The block starts within the line that has the number of lines
+        # before the block as number
+        offset = self.data.rfind(b"\n", 0, block * self.BLOCK) + 1
+        for _ in range(line - lines[block]):
+            offset = self._next(offset)
+            if offset is None:
+                return None
+        # The end of the last line is not the start of another one
+        return offset if offset < self.size or not line else None
+
+    # NAVIGATION
+    # -------------------------------------------------------------------------
+
+    def _next(self, offset):
+        """Returns the offset of the line after the one at the given offset,
+        or 'None' if it is the last one."""
+        end = self.data.find(b"\n", offset)
+        return end + 1 if end != -1 and end + 1 < self.size else None
+
+    def _previous(self, offset):
+        """Returns the offset of the line before the one at the given
+        offset, or 'None' if it is the first one."""
+        return self.data.rfind(b"\n", 0, offset - 1) + 1 if offset > 0 else None
+
+    def goto(self, line):
+        """Scrolls to the given line (the last one if there are less)."""
+        offset = self.offsetOf(max(0, line))
+        self._scroll(self._last() if offset is None else offset)
+
+    def _last(self):
+        """Returns the offset of the last line."""
+        return self.data.rfind(b"\n", 0, self.size - 1) + 1 if self.size else 0
+
+    def _scroll(self, offset):
+        if offset is not None and offset != self.offset:
+            self.offset = offset
+            self._invalidate()
+
+    def search(self, pattern, backward=False):
+        """Scrolls to the next line (or the previous one when 'backward')
+        matching the given regular expression, which is searched in the
+        mapped file without copying it. Tells if a match was found."""
+        if isinstance(pattern, str):
+            pattern = pattern.encode(self.encoding or ENCODING)
+        regexp = re.compile(pattern, re.MULTILINE)
+        data = self.data
+        match = None
+        # A file that ends with a new line has no empty line after it
+        size = self.size - 1 if data[-1:] == b"\n" else self.size
+        # The file is scanned in windows of whole lines, from the top line,
+        # which end before a new line so that it does not start another one
+        if not backward:
+            start = self._next(self.offset)
+            while start is not None and start <= size and not match:
+                end = data.find(b"\n", start + self.WINDOW, size)
+                end = size if end == -1 else end
+                match = regexp.search(data, start, end)
+                self._release(start, end)
+                start = end + 1
+        else:
+            end = self.offset
+            while end > 0 and not match:
+                start = data.rfind(b"\n", 0, max(0, end - self.WINDOW)) + 1
+                for match in regexp.finditer(data, start, end - 1):
+                    pass
+                self._release(start, end)
+                end = start
+        if match:
+            self._scroll(data.rfind(b"\n", 0, match.start()) + 1)
+        return bool(match)
+
+    def keypress(self, size, key):
+        (maxcol, maxrow) = size
+        offset = self.offset
+        if key == "up":
+            offset = self._previous(offset)
+        elif key == "down":
+            offset = self._next(offset)
+        elif key in ("page up", "page down"):
+            step = self._previous if key == "page up" else self._next
+            for _ in range(maxrow - 1):
+                following = step(offset)
+                if following is None:
+                    break
+                offset = following
+        elif key == "home":
+            offset = 0
+        elif key == "end":
+            # The last page is full, unless the file is shorter
+            offset = self._last()
+            for _ in range(maxrow - 1):
+                offset = self._previous(offset) or 0
+        elif key == "left" and self.left > 0:
+            self.left = max(0, self.left - maxcol // 2)
+            self._invalidate()
+            return None
+        elif key == "right":
+            self.left += maxcol // 2
+            self._invalidate()
+            return None
+        else:
+            return key
+        if offset is None or offset == self.offset:
+            # We forward the keys at the first and last line, so that the
+            # focus can move to the other widgets
+            return key if key in ("up", "down") else None
+        self._scroll(offset)
+        return None
+
+    def render(self, size, focus=False):
+        (maxcol, maxrow) = size
+        data = self.data
+        encoding = self.encoding or ENCODING
+        # A line longer than the screen is only decoded as far as visible
+        limit = 4 * (self.left + maxcol) + 64
+        text, cs = [], []
+        offset = self.offset if self.size else None
+        while offset is not None and len(text) < maxrow:
+            end = data.find(b"\n", offset, offset + limit)
+            line = data[offset : end if end != -1 else offset + limit]
+            line = line.rstrip(b"\r").decode(encoding, "replace").expandtabs()
+            row = layout_row(line[self.left :], maxcol)
+            text.append(row[0])
+            cs.append(row[1])
+            offset = self._next(offset)
+        self._visible = (self.offset, self.size if offset is None else offset)
+        blank = b" " * maxcol
+        for _ in range(maxrow - len(text)):
+            text.append(blank)
+            cs.append([])
+        return urwid.TextCanvas(text, cs=cs, maxcol=maxcol)
+
+
+# ------------------------------------------------------------------------------
+#
+# METERS
+#
+# ------------------------------------------------------------------------------
+
+
+# NumPy is imported by the first series, as it is slow to import (see
+# 'numpy_module')
+NUMPY = []
+
+
+def numpy_module():
+    """Returns the 'numpy' module, or 'None' when it is not installed."""
+    if not NUMPY:
+        try:
+            import numpy
+        except ImportError:
+            numpy = None
+        NUMPY.append(numpy)
+    return NUMPY[0]
+
+
+class Series:
+    """A ring buffer of numeric samples, which keeps the last 'capacity'
+    ones. The samples are held in a NumPy array when NumPy is available, and
+    in an 'array' of doubles otherwise, so that feeding a series does not
+    keep an object per sample. The meters displaying a series are redrawn
+    when its 'count' of samples changes (see 'Meter.refresh').
+
+    The 'low' and 'high' bounds of the values default to the extrema of the
+    displayed samples. The callbacks given to 'watch' are invoked when
+    samples are added."""
+
+    def __init__(self, capacity=1024, low=None, high=None):
+        self.capacity = capacity
+        self.low = low
+        self.high = high
+        self.count = 0
+        self._watchers = []
+        self._numpy = numpy = numpy_module()
+        if numpy:
+            self.data = numpy.zeros(capacity)
+        else:
+            self.data = array.array("d", bytes(8 * capacity))
+
+    def __len__(self):
+        return min(self.count, self.capacity)
+
+    def watch(self, callback):
+        """Invokes the given bound method when samples are added. The method
+        is weakly referenced, so that watching a series does not keep its
+        object alive."""
+        self._watchers.append(weakref.WeakMethod(callback))
+
+    def _changed(self):
+        for watcher in self._watchers:
+            callback = watcher()
+            if callback:
+                callback()
+
+    def append(self, value):
+        self.data[self.count % self.capacity] = value
+        self.count += 1
+        if self._watchers:
+            self._changed()
+
+    def extend(self, values):
+        """Appends the given sequence of samples at once, of which only the
+        last 'capacity' ones are copied."""
+        numpy = self._numpy
+        if numpy:
+            values = numpy.asarray(values, dtype=float).ravel()
+        elif not isinstance(values, array.array) or values.typecode != "d":
+            values = array.array("d", values)
+        n, capacity = len(values), self.capacity
+        if n > capacity:
+            self.count += n - capacity
+            values = values[n - capacity :]
+            n = capacity
+        start = self.count % capacity
+        head = min(n, capacity - start)
+        self.data[start : start + head] = values[:head]
+        self.data[: n - head] = values[head:]
+        self.count += n
+        if self._watchers:
+            self._changed()
+
+    def last(self, default=0.0):
+        """Returns the last sample, or 'default' if there is none."""
+        if not self.count:
+            return default
+        return float(self.data[(self.count - 1) % self.capacity])
+
+    def values(self):
+        """Returns the samples, from the oldest to the newest."""
+        numpy = self._numpy
+        data, count, capacity = self.data, self.count, self.capacity
+        if count <= capacity:
+            return data[:count]
+        start = count % capacity
+        if numpy:
+            return numpy.concatenate((data[start:], data[:start]))
+        return data[start:] + data[:start]
+
+    def extrema(self):
+        """Returns the '(min, max)' of the samples, or 'None' if there is
+        none."""
+        numpy = self._numpy
+        values = self.values()
+        if not len(values):
+            return None
+        elif numpy:
+            return (float(values.min()), float(values.max()))
+        else:
+            return (min(values), max(values))
+
+    def bounds(self):
+        """Returns the '(low, high)' bounds of the series, the missing ones
+        being the extrema of the samples."""
+        low, high = self.low, self.high
+        if low is None or high is None:
+            extrema = self.extrema() or (0.0, 0.0)
+            low = extrema[0] if low is None else low
+            high = extrema[1] if high is None else high
+        return (low, high)
+
+    def downsample(self, width):
+        """Returns at most 'width' values, which are the maxima of the
+        samples in as many buckets of (nearly) equal size, so that the peaks
+        are kept. With NumPy, the buckets are reduced in a single call."""
+        numpy = self._numpy
+        values = self.values()
+        n = len(values)
+        if n <= width:
+            return values
+        if numpy:
+            return numpy.maximum.reduceat(values, numpy.arange(width) * n // width)
+        edges = [i * n // width for i in range(width + 1)]
+        return [max(values[edges[i] : edges[i + 1]]) for i in range(width)]
+
+    def levels(self, width, levels):
+        """Returns the downsampled values (see 'downsample') scaled from the
+        bounds of the series to integers between '0' and 'levels - 1'."""
+        numpy = self._numpy
+        values = self.downsample(width)
+        low, high = self.bounds()
+        scale = (levels - 1) / ((high - low) or 1.0)
+        if numpy:
+            return ((values - low) * scale).clip(0, levels - 1).astype(int).tolist()
+        return [min(max(int((_ - low) * scale), 0), levels - 1) for _ in values]
+
+
+class Meter(urwid.Widget):
+    """The base class of the one-row widgets that display a 'Series' after
+    an optional 'label'. Feeding the series does not redraw the meter: the
+    UI refreshes the meters whose series changed at most once per frame
+    (see 'UI.METER_DELAY'), however often they are fed. A meter creates its
+    own series, unless one is given to share it with other meters."""
+
+    _sizing = frozenset([FLOW])
+
+    def __init__(self, label="", series=None, capacity=1024, low=None, high=None):
+        super().__init__()
+        self.label = label
+        self.series = series if series is not None else Series(capacity, low, high)
+        self._count = None
+
+    def rows(self, size, focus=False):
+        return 1
+
+    def refresh(self):
+        """Invalidates the meter if its series changed since the last
+        refresh, and tells if it did."""
+        count = self.series.count
+        if count == self._count:
+            return False
+        self._count = count
+        self._invalidate()
+        return True
+
+    def render(self, size, focus=False):
+        (maxcol,) = size
+        label = self.label + " " if self.label else ""
+        width = max(0, maxcol - urwid.calc_width(label, 0, len(label)))
+        text, cs = layout_row(label + self.draw(width), maxcol)
+        return urwid.TextCanvas([text], cs=[cs], maxcol=maxcol)
+
+    def draw(self, width):
+        """Returns the text of the meter, in 'width' columns."""
+        raise Exception("Must be implemented by subclasses")
+
+
+# The eighths of a cell, which draw the bars at a sub-cell resolution
+EIGHTHS = " ▏▎▍▌▋▊▉█"
+
+
+def draw_bar(ratio, width):
+    """Returns a bar that fills the given 'ratio' of 'width' columns."""
+    eighths = int(min(max(ratio, 0.0), 1.0) * width * 8)
+    bar = "█" * (eighths // 8)
+    if eighths % 8:
+        bar += EIGHTHS[eighths % 8]
+    return bar + " " * (width - len(bar))
+
+
+class Progress(Meter):
+    """Displays the completion of the last sample between the 'low' and
+    'high' bounds (0 and 100 by default) as a bar and a percentage."""
+
+    def __init__(self, label="", series=None, capacity=16, low=0, high=100):
+        super().__init__(label, series, capacity, low, high)
+
+    def draw(self, width):
+        low, high = self.series.bounds()
+        ratio = (self.series.last(low) - low) / ((high - low) or 1.0)
+        text = " %3d%%" % round(100 * min(max(ratio, 0.0), 1.0))
+        return draw_bar(ratio, max(0, width - len(text))) + text
+
+
+class Gauge(Meter):
+    """Displays the last sample between the 'low' and 'high' bounds (0 and
+    100 by default) as a bar with a mark at the peak of the series, followed
+    by the value formatted with 'value_format'."""
+
+    PEAK = "│"
+
+    def __init__(
+        self,
+        label="",
+        series=None,
+        capacity=256,
+        low=0,
+        high=100,
+        value_format="%.1f",
+    ):
+        super().__init__(label, series, capacity, low, high)
+        self.value_format = value_format
+
+    def draw(self, width):
+        series = self.series
+        low, high = series.bounds()
+        value = series.last(low)
+        text = " " + self.value_format % value
+        width = max(0, width - len(text))
+        bar = draw_bar((value - low) / ((high - low) or 1.0), width)
+        extrema = series.extrema()
+        if extrema:
+            peak = int((extrema[1] - low) / ((high - low) or 1.0) * width)
+            if 0 <= peak < width and bar[peak] == " ":
+                bar = bar[:peak] + self.PEAK + bar[peak + 1 :]
+        return bar + text
+
+
+class Sparkline(Meter):
+    """Displays the samples of the series, downsampled to one per column
+    (see 'Series.downsample'), the newest ones on the right."""
+
+    BARS = "▁▂▃▄▅▆▇█"
+
+    def draw(self, width):
+        bars = self.BARS
+        line = "".join([bars[_] for _ in self.series.levels(width, len(bars))])
+        return line.rjust(width)
+
+
+# ------------------------------------------------------------------------------
+#
+# TILE GRID
+#
+# ------------------------------------------------------------------------------
+
+
+class TileGrid(urwid.Widget):
+    """A grid of tiles, one per item, for thousands of items. Unlike a
+    'GridFlow', the grid holds no widget per item: its geometry is computed
+    from the 'cell_width' and the width of the screen, and only the tiles of
+    the visible rows are rendered, with a pool of text widgets that are
+    relabeled as the grid scrolls. The focus is the 'position' of an item, moved
+    with the arrows, page up/down, home and end.
+
+    The tile of an item displays 'label(item)', which can be text markup,
+    between brackets when focused, with the 'attr' and 'focus_attr'
+    attributes. Enter (or space) calls 'on_press(grid, index)'. Being a box
+    widget, it is given a height in a list box (see 'UI._parseGrd')."""
+
+    _sizing = frozenset([BOX])
+    _selectable = True
+
+    def __init__(
+        self,
+        items=(),
+        cell_width=10,
+        h_sep=1,
+        v_sep=0,
+        label=str,
+        attr=None,
+        focus_attr=None,
+        on_press=None,
+    ):
+        super().__init__()
+        self.items = list(items)
+        self.cell_width = cell_width
+        self.h_sep = h_sep
+        self.v_sep = v_sep
+        self.label = label
+        self.attr = attr
+        self.focus_attr = focus_attr
+        self.on_press = on_press
+        self.position = 0
+        self.top = 0
+        self._tiles = []
+        self._shown = []
+        self._rows = {}
+
+    def setItems(self, items):
+        """Replaces the items, keeping the focus on the same index when it
+        still exists."""
+        self.items = list(items)
+        self.position = max(0, min(self.position, len(self.items) - 1))
+        self.refresh()
+
+    def refresh(self):
+        """Redraws the grid, after its items were changed in place."""
+        self._shown = [None] * len(self._shown)
+        self._invalidate()
+
+    def focusedItem(self):
+        return self.items[self.position] if self.items else None
+
+    def setFocus(self, index):
+        self.position = max(0, min(index, len(self.items) - 1))
+        self._invalidate()
+
+    def columns(self, maxcol):
+        """Returns the number of tiles per row for the given width."""
+        return max(1, (maxcol + self.h_sep) // (self.cell_width + self.h_sep))
+
+    def _visibleRows(self, maxrow):
+        return max(1, (maxrow + self.v_sep) // (1 + self.v_sep))
+
+    def _scroll(self, maxcol, maxrow):
+        """Updates the top row so that the focused one is visible, and
+        returns the number of columns and of visible rows."""
+        columns = self.columns(maxcol)
+        visible = self._visibleRows(maxrow)
+        row = self.position // columns
+        if row < self.top:
+            self.top = row
+        elif row >= self.top + visible:
+            self.top = row - visible + 1
+        last = (len(self.items) - 1) // columns
+        self.top = max(0, min(self.top, last - visible + 1))
+        return columns, visible
+
+    def keypress(self, size, key):
+        (maxcol, maxrow) = size
+        columns, visible = self._scroll(maxcol, maxrow)
+        count = len(self.items)
+        focus = self.position
+        if key == "left":
+            focus -= 1
+        elif key == "right":
+            focus += 1
+        elif key == "up":
+            focus -= columns
+        elif key == "down":
+            focus += columns
+        elif key == "page up":
+            focus -= columns * visible
+        elif key == "page down":
+            focus += columns * visible
+        elif key == "home":
+            focus = 0
+        elif key == "end":
+            focus = count - 1
+        elif key in ("enter", " ") and count:
+            if self.on_press:
+                self.on_press(self, self.position)
+            return None
+        else:
+            return key
+        if key in ("page up", "page down"):
+            focus = max(0, min(focus, count - 1))
+        elif focus < 0 or focus >= count:
+            # We forward the keys that move out of the grid, so that the
+            # focus can move to the other widgets
+            return key if key in ("up", "down") else None
+        if focus != self.position:
+            self.position = focus
+            self._invalidate()
+        return None
+
+    def _tile(self, slot, markup, attr):
+        """Returns the tile widget of the given slot, updated to display the
+        given markup with the given attribute."""
+        while slot >= len(self._tiles):
+            self._tiles.append(urwid.AttrMap(urwid.Text("", wrap=CLIP), None))
+            self._shown.append(None)
+        tile = self._tiles[slot]
+        # A tile that displays the same is not updated, so that its canvas is
+        # reused
+        if self._shown[slot] != (markup, attr):
+            self._shown[slot] = (markup, attr)
+            tile.original_widget.set_text(markup)
+            tile.set_attr_map({None: attr})
+        return tile
+
+    def _markup(self, index, focused):
+        label = self.label(self.items[index])
+        if isinstance(label, str):
+            width = self.cell_width - 2
+            if not label.isascii():
+                width, _ = urwid.util.calc_text_pos(label, 0, len(label), width)
+            label = label[:width]
+        return ["[", label, "]"] if focused else [" ", label, " "]
+
+    def render(self, size, focus=False):
+        (maxcol, maxrow) = size
+        columns, visible = self._scroll(maxcol, maxrow)
+        width = self.cell_width
+        # An item keeps its slot (and tile) while it is visible, so that only
+        # the tiles of the rows scrolled into view are relabeled
+        slots = columns * visible
+        rows, rows_cache = [], {}
+        for row in range(self.top, self.top + visible):
+            start = row * columns
+            if start >= len(self.items):
+                break
+            cells = []
+            for index in range(start, min(start + columns, len(self.items))):
+                focused = focus and index == self.position
+                attr = self.focus_attr if focused else self.attr
+                tile = self._tile(index % slots, self._markup(index, focused), attr)
+                cells.append((tile.render((width,)), None, False, width + self.h_sep))
+            # A row is only joined again when one of its tiles changed
+            key = (maxcol,) + tuple(_[0] for _ in cells)
+            joined = self._rows.get(row)
+            if not joined or joined[0] != key:
+                canvas = urwid.CanvasJoin(cells)
+                canvas.pad_trim_left_right(0, maxcol - canvas.cols())
+                joined = rows_cache[row] = (key, canvas)
+            else:
+                rows_cache[row] = joined
+            rows.append((joined[1], None, False))
+            if self.v_sep:
+                rows.append((urwid.SolidCanvas(" ", maxcol, self.v_sep), None, False))
+        self._rows = rows_cache
+        if not rows:
+            return urwid.SolidCanvas(" ", maxcol, maxrow)
+        canvas = urwid.CanvasCombine(rows)
+        canvas.pad_trim_top_bottom(0, maxrow - canvas.rows())
+        return canvas
+
+
 # ------------------------------------------------------------------------------
 #
 # URWID Patching
@@ -221,6 +1867,119 @@ class PatchedColumns(urwid.Columns):
 # urwid.ListBox = PatchedListBox
 # urwid.Columns = PatchedColumns
 
+# ------------------------------------------------------------------------------
+#
+# KEYMAPS
+#
+# ------------------------------------------------------------------------------
+
+
+class Keymap:
+    """A keymap binds key sequences to events (or callbacks). A sequence is
+    either a single key (`ctrl s`) or a chord of keys separated by commas
+    (`ctrl x, ctrl s`). Keymaps are compiled into a trie (see 'compile')
+    where each node is a dict mapping the next key to the next node, and
+    where the 'None' key holds the bound event."""
+
+    def __init__(self):
+        self.bindings = collections.OrderedDict()
+
+    @staticmethod
+    def parse(keys):
+        """Returns the given key sequence as a tuple of URWID key names."""
+        if type(keys) in (str,):
+            keys = keys.split(",")
+        return tuple(" ".join(_.split()) for _ in keys if _.strip())
+
+    def bind(self, keys, event):
+        """Binds the given key sequence to the given event name or callback."""
+        keys = self.parse(keys)
+        if not keys:
+            raise UISyntaxError("Empty key sequence")
+        self.bindings[keys] = event
+
+    def unbind(self, keys):
+        """Removes the binding for the given key sequence, if any."""
+        self.bindings.pop(self.parse(keys), None)
+
+    def compile(self, trie=None):
+        """Adds the bindings of this keymap to the given trie (a new one by
+        default), overriding any binding for the same sequence."""
+        trie = {} if trie is None else trie
+        for keys, event in self.bindings.items():
+            node = trie
+            for key in keys:
+                node = node.setdefault(key, {})
+            node[None] = event
+        return trie
+
+
+# ------------------------------------------------------------------------------
+#
+# RATE LIMITING
+#
+# ------------------------------------------------------------------------------
+
+
+class RateLimit:
+    """Wraps an event (an event name or a callback) so that it is triggered
+    at most once per 'delay' (in seconds), using the timers of the 'ui' (see
+    'UI.after'):
+
+    - in 'debounce' mode, the event is triggered once the calls have stopped
+      for 'delay', with the arguments of the last call.
+    - in 'throttle' mode, the event is triggered right away, and then at most
+      once every 'delay' with the arguments of the last call.
+
+    The optional 'merge' function combines the arguments of a pending call
+    with the ones of the new call (see 'mergeEdit')."""
+
+    DEBOUNCE = "debounce"
+    THROTTLE = "throttle"
+
+    def __init__(self, ui, event, delay, mode=DEBOUNCE, merge=None):
+        self.ui = ui
+        self.event = event
+        self.delay = delay
+        self.mode = mode
+        self.merge = merge
+        self._args = None
+        self._timer = None
+        self._last = 0
+
+    @staticmethod
+    def mergeEdit(pending, args):
+        """Merges '(widget, before, after)' arguments, keeping the text from
+        before the first edit and the text after the last one, or the
+        '(widget, deltas)' of a 'DocEdit', concatenating the deltas."""
+        if isinstance(args[0], DocEdit):
+            return (args[0], pending[1] + args[1])
+        return args[:1] + pending[1:2] + args[2:]
+
+    def __call__(self, *args):
+        if self._args is not None and self.merge:
+            self._args = self.merge(self._args, args)
+        else:
+            self._args = args
+        if self.mode == self.DEBOUNCE:
+            if self._timer:
+                self.ui.cancel(self._timer)
+            self._timer = self.ui.after(self.delay, self.fire)
+        elif not self._timer:
+            wait = self._last + self.delay - time.time()
+            if wait <= 0:
+                self.fire()
+            else:
+                self._timer = self.ui.after(wait, self.fire)
+
+    def fire(self):
+        """Triggers the event with the pending arguments, if any."""
+        args, self._args, self._timer = self._args, None, None
+        if args is not None:
+            self._last = time.time()
+            self.ui._handle(self.event, *args)
+
+
 # ------------------------------------------------------------------------------
 #
 # UI CLASS
@@ -251,17 +2010,21 @@ class UI:
     class Collection(object):
         """Keys of the given collection are recognized as attributes."""
 
-        def __init__(self, collection=None):
+        def __init__(self, collection=None, missing=None):
             object.__init__(self)
             if collection == None:
                 collection = {}
             self.w_w_content = collection
+            # Called with the name of a missing key, which may add it
+            self.w_w_missing = missing
 
         def __getattr__(self, name):
             if name.startswith("w_w_"):
                 return super(UI.Collection, self).__getattribute__(name)
             else:
                 w = self.w_w_content
+                if name not in w and self.w_w_missing:
+                    self.w_w_missing(name)
                 if name not in w:
                     raise UIRuntimeError("No widget with name: " + name)
                 return w[name]
@@ -284,22 +2047,40 @@ class UI:
         self._palette = None
         self._header = None
         self._currentSize = None
-        self._widgets = {}
+        # Widgets are only registered as long as they are alive
+        self._widgets = weakref.WeakValueDictionary()
         self._groups = {}
         self._strings = {}
         self._data = {}
         self._handlers = []
-        self.widgets = UI.Collection(self._widgets)
-        self.groups = UI.Collection(self._groups)
+        self._active = None
+        self._keymaps = [Keymap()]
+        self._keys = None
+        self._chord = None
+        self._chordTime = 0
+        self._chordTimer = None
+        self._timers = []
+        self._timerCount = 0
+        self._static = weakref.WeakSet()
+        self._meters = weakref.WeakSet()
+        self._meterTimer = None
+        self._deferred = []
+        self._deferring = False
+        self._progressive = False
+        self._pending = None
+        self._pendingAt = 0
+        self._prebuilt = {}
+        self._placeholder = None
+        self._route = None
+        self.stats = Stats()
+        self.widgets = UI.Collection(self._widgets, self._buildWidget)
+        self.groups = UI.Collection(self._groups, self._buildGroup)
         self.strings = UI.Collection(self._strings)
         self.data = UI.Collection(self._data)
 
     def id(self, widget):
         """Returns the id for the given widget."""
-        if hasattr(widget, "_urwideId"):
-            return widget._urwideId
-        else:
-            return None
+        return widget_meta(widget, "id")
 
     def new(self, widgetClass, *args, **kwargs):
         """Creates the given widget by instanciating @widgetClass with the given
@@ -352,6 +2133,7 @@ class UI:
                 self._handlers.append((handler, old_ui))
             else:
                 self._handlers[-1] = (handler, old_ui)
+            self._active = handler
 
     def responder(self, event):
         """Returns the function that responds to the given event."""
@@ -362,6 +2144,9 @@ class UI:
         events until it is popped out or replaced."""
         self._handlers.append((handler, handler.ui))
         handler.ui = self
+        self._active = handler
+        self._keymaps.append(Keymap())
+        self._keys = None
 
     def popHandler(self):
         """Pops the current handler of the list of handlers. The handler will
@@ -369,14 +2154,25 @@ class UI:
         handle events."""
         handler, ui = self._handlers.pop()
         handler.ui = ui
+        self._active = self._handlers[-1][0] if self._handlers else None
+        if len(self._keymaps) > 1:
+            self._keymaps.pop()
+        self._keys = None
+
+    def _lookup(self, event_name):
+        """Returns the responder of the current handler for the given event
+        name, or 'None'. Unlike 'responder', this never raises."""
+        return self._active.lookup(event_name) if self._active else None
 
     def _handle(self, event_name, widget, *args, **kwargs):
         """Handle the given given event name."""
         # If the event is an event name, we use the handler mechanism
         if type(event_name) in (str,):
-            handler = self.handler()
-            if handler.responds(event_name):
-                return handler.respond(event_name, widget, *args, **kwargs)
+            if not self._active:
+                raise UIRuntimeError("No handler defined for: %s" % (self))
+            responder = self._active.lookup(event_name)
+            if responder:
+                return responder(widget, *args, **kwargs) != FORWARD
             elif hasattr(widget, event_name):
                 getattr(widget, event_name, *args, **kwargs)
             else:
@@ -387,35 +2183,192 @@ class UI:
         else:
             return event_name(widget, *args, **kwargs)
 
+    # KEY BINDINGS
+    # -------------------------------------------------------------------------
+
+    CHORD_TIMEOUT = 1.0
+
+    def bind(self, keys, event):
+        """Binds the given key sequence (eg. `"ctrl x, ctrl s"`) to the given
+        event name (`"save"` calls the handler's `onSave`) or callback.
+
+        Bindings belong to the current handler layer: they are removed when
+        the handler is popped (see 'pushHandler')."""
+        self._keymaps[-1].bind(keys, event)
+        self._keys = None
+
+    def unbind(self, keys):
+        """Removes the binding of the given key sequence from the current
+        handler layer."""
+        self._keymaps[-1].unbind(keys)
+        self._keys = None
+
+    def bindings(self):
+        """Returns the list of active bindings as '(keys, event, layer)'
+        tuples, where 'keys' is the key sequence as text. This is useful to
+        display a help overlay."""
+        res = collections.OrderedDict()
+        for layer, keymap in enumerate(self._keymaps):
+            for keys, event in keymap.bindings.items():
+                res.pop(keys, None)
+                res[keys] = (", ".join(keys), event, layer)
+        return list(res.values())
+
+    def _keymap(self):
+        """Returns the compiled trie of the active bindings, which is only
+        rebuilt when the bindings or the handler layers change."""
+        if self._keys is None:
+            trie = {}
+            for _ in self._keymaps:
+                _.compile(trie)
+            self._keys = trie
+        return self._keys
+
+    def _doBinding(self, widget, key, editable=False):
+        """Resolves the given key against the active bindings, triggering
+        the bound event when a sequence is complete. Returns 'True' when the
+        key was consumed. When the focused widget is 'editable', single
+        character keys are not matched unless they continue a chord."""
+        node = self._chord
+        if node is not None:
+            self._chord = None
+            self.cancel(self._chordTimer)
+            if time.time() - self._chordTime <= self.CHORD_TIMEOUT:
+                child = node.get(key)
+            else:
+                child = None
+            if child is None:
+                # The chord is broken (or expired before its timer ran): a
+                # binding of the chord prefix is triggered before processing
+                # the key on its own.
+                if None in node:
+                    self._handle(node[None], widget)
+                return self._doBinding(widget, key, editable)
+            node = child
+        else:
+            if editable and len(key) == 1:
+                return False
+            node = self._keymap().get(key)
+            if node is None:
+                return False
+        if len(node) > 1 or None not in node:
+            self._chord = node
+            self._chordTime = time.time()
+            self._chordTimer = self.after(
+                self.CHORD_TIMEOUT, self._chordExpired, widget
+            )
+        else:
+            self._handle(node[None], widget)
+        return True
+
+    def _chordExpired(self, widget):
+        """Ends the pending chord when no key continued it in time,
+        triggering the binding of its prefix, if any."""
+        node, self._chord = self._chord, None
+        if node is not None and None in node:
+            self._handle(node[None], widget)
+
+    # TIMERS
+    # -------------------------------------------------------------------------
+
+    def after(self, delay, callback, *args):
+        """Schedules the given callback to be invoked with the given 'args'
+        after 'delay' seconds, returning a timer that can be given to
+        'cancel'. Timers are run by the console loop."""
+        self._timerCount += 1
+        timer = [time.time() + delay, self._timerCount, callback, args]
+        heapq.heappush(self._timers, timer)
+        return timer
+
+    def cancel(self, timer):
+        """Cancels the given timer (see 'after')."""
+        timer[2] = None
+
+    def _runTimers(self):
+        """Runs the timers that are due, and returns the number of seconds
+        until the next timer, or 'None' if there is none. The timers that
+        are scheduled while running are due at the next run at the earliest,
+        so that a timer that reschedules itself leaves room for the keys."""
+        timers = self._timers
+        now = time.time()
+        while timers:
+            timer = timers[0]
+            if timer[0] > now and timer[2]:
+                return max(0.0, timer[0] - time.time())
+            heapq.heappop(timers)
+            if timer[2]:
+                timer[2](*timer[3])
+        return None
+
+    def _timerWait(self):
+        """Returns the number of seconds until the next timer is due (see
+        '_runTimers'), or 'None' if there is none."""
+        timers = self._timers
+        while timers and not timers[0][2]:
+            heapq.heappop(timers)
+        return max(0.0, timers[0][0] - time.time()) if timers else None
+
+    def _rateLimit(self, event, handler, debounce=None, throttle=None):
+        """Returns the given handler wrapped in a 'RateLimit' when 'debounce'
+        or 'throttle' (in seconds) are given."""
+        merge = RateLimit.mergeEdit if event == "edit" else None
+        if debounce:
+            return RateLimit(self, handler, debounce, RateLimit.DEBOUNCE, merge)
+        elif throttle:
+            return RateLimit(self, handler, throttle, RateLimit.THROTTLE, merge)
+        else:
+            return handler
+
+    RE_RATE = re.compile("^(.+)([~\\^])([\\d\\.]+)(ms|s)$")
+
+    def _parseEvent(self, event, handler):
+        """Parses the handler of an event attribute, which can be suffixed by
+        a rate limit: `search~300ms` debounces and `search^1s` throttles the
+        `search` event."""
+        match = self.RE_RATE.match(handler)
+        if not match:
+            return handler
+        handler, mode, delay, unit = match.groups()
+        delay = float(delay) / (1000.0 if unit == "ms" else 1.0)
+        if mode == "~":
+            return self._rateLimit(event, handler, debounce=delay)
+        else:
+            return self._rateLimit(event, handler, throttle=delay)
+
     def setTooltip(self, widget, tooltip):
-        widget._urwideTooltip = tooltip
+        set_widget_meta(widget, "tooltip", tooltip)
 
     def setInfo(self, widget, info):
-        widget._urwideInfo = info
+        set_widget_meta(widget, "info", info)
 
-    def onKey(self, widget, callback):
+    def onKey(self, widget, callback, debounce=None, throttle=None):
         """Sets a callback to the given widget for the 'key' event"""
         widget = self.unwrap(widget)
-        widget._urwideOnKey = callback
+        set_widget_meta(widget, "onKey", self._rateLimit("key", callback, debounce, throttle))
 
-    def onFocus(self, widget, callback):
+    def onFocus(self, widget, callback, debounce=None, throttle=None):
         """Sets a callback to the given widget for the 'focus' event"""
         widget = self.unwrap(widget)
-        widget._urwideOnFocus = callback
+        set_widget_meta(widget, "onFocus", self._rateLimit("focus", callback, debounce, throttle))
 
-    def onEdit(self, widget, callback):
-        """Sets a callback to the given widget for the 'edit' event"""
+    def onEdit(self, widget, callback, debounce=None, throttle=None):
+        """Sets a callback to the given widget for the 'edit' event. When
+        'debounce' is given (in seconds), the callback is only invoked once the
+        edits have stopped for that long, 'throttle' invokes it at most once
+        per given delay."""
         widget = self.unwrap(widget)
-        widget._urwideOnEdit = callback
+        set_widget_meta(widget, "onEdit", self._rateLimit("edit", callback, debounce, throttle))
 
-    def onPress(self, widget, callback):
+    def onPress(self, widget, callback, debounce=None, throttle=None):
         """Sets a callback to the given widget for the 'edit' event"""
         widget = self.unwrap(widget)
-        widget._urwideOnPress = callback
+        set_widget_meta(widget, "onPress", self._rateLimit("press", callback, debounce, throttle))
+        if isinstance(widget, TileGrid):
+            widget.on_press = self._doPress
 
     def _doPress(self, button, *args):
-        if hasattr(button, "_urwideOnPress"):
-            event_name = button._urwideOnPress
+        event_name = widget_meta(button, "onPress")
+        if event_name:
             self._handle(event_name, button, *args)
         elif isinstance(button, urwid.RadioButton):
             return False
@@ -425,18 +2378,20 @@ class UI:
             )
 
     def _doFocus(self, widget, ensure=True):
-        if hasattr(widget, "_urwideOnFocus"):
-            event_name = widget._urwideOnFocus
+        event_name = widget_meta(widget, "onFocus")
+        if event_name:
             self._handle(event_name, widget)
         elif ensure:
             raise UIRuntimeError(
                 "Widget does not respond to focus event: %s" % (widget)
             )
 
-    def _doEdit(self, widget, before, after, ensure=True):
-        if hasattr(widget, "_urwideOnEdit"):
-            event_name = widget._urwideOnEdit
-            self._handle(event_name, widget, before, after)
+    def _doEdit(self, widget, *changes, ensure=True):
+        # The changes are the text before and after for an Edit, and the
+        # list of deltas for a DocEdit
+        event_name = widget_meta(widget, "onEdit")
+        if event_name:
+            self._handle(event_name, widget, *changes)
         elif ensure:
             raise UIRuntimeError("Widget does not respond to focus edit: %s" % (widget))
 
@@ -451,41 +2406,227 @@ class UI:
         #    focused widget is not editable
         # 4) If no keyPresss handler is defined, the default key_press event is
         #    handled
+        topwidget, stack, editable = self._keyRoute(widget)
+        # FIXME: Dialogs should prevent processing of events at a lower level
+        for widget in stack:
+            event_name = widget_meta(widget, "onKey")
+            if event_name and self._handle(event_name, widget, key):
+                return
+        if self._doBinding(topwidget, key, editable):
+            return
+        if key == "tab":
+            self.focusNext()
+        elif key == "shift tab":
+            self.focusPrevious()
+        responder = self._lookup("keyPress")
+        if responder and not editable:
+            res = responder(topwidget, key) != FORWARD
+        else:
+            res = False
+        if res is False:
+            topwidget.keypress(self._currentSize, key)
+
+    def _keyRoute(self, widget):
+        """Returns the '(toplevel, stack, editable)' route of the keys sent to
+        the given widget: 'stack' is the chain of widgets (see
+        'original_widgets') whose key handlers are tried in order, before the
+        bindings and the toplevel widget. The route is kept until the focus
+        or the toplevel changes, or the UI is modified (see 'isModified')."""
+        route = self._route
         topwidget = self.getToplevel()
-        current_widget = widget
+        if (
+            route
+            and route[0] is widget
+            and route[1] is topwidget
+            and not self.isModified()
+        ):
+            return route[1:]
         # We traverse the `original_widget` in case the widgets are nested.
-        # This allows to get the deepest widget.
+        # This allows to get the deepest widget. An empty container is falsy,
+        # in which case the keys go to the toplevel widget handlers.
         stack = original_widgets(widget)
-        # FIXME: Dialogs should prevent processing of events at a lower level
-        if stack:
-            for widget in stack:
-                if hasattr(widget, "_urwideOnKey"):
-                    event_name = widget._urwideOnKey
-                    if self._handle(event_name, widget, key):
-                        return
-            if current_widget != topwidget and current_widget not in stack:
-                self._doKeyPress(topwidget, key)
-            else:
-                self._doKeyPress(None, key)
-        elif widget and widget != topwidget:
-            self._doKeyPress(topwidget, key)
-        else:
-            if key == "tab":
-                self.focusNext()
-            elif key == "shift tab":
-                self.focusPrevious()
-            if self.isEditable(self.getFocused()):
-                res = False
+        if not stack and widget is not None and widget is not topwidget:
+            stack = original_widgets(topwidget)
+        route = (widget, topwidget, stack, self.isEditable(self.getFocused()))
+        self._route = route
+        return route[1:]
+
+    def isModified(self):
+        """Tells if the UI may have been modified (including its focus)
+        since it was last drawn. The UI is always considered modified unless
+        the subclass can tell otherwise."""
+        return True
+
+    def getFocused(self):
+        raise Exception("Must be implemented by subclasses")
+
+    def render(self, size):
+        """Renders the UI at the given '(cols, rows)' size and returns the
+        canvas."""
+        raise Exception("Must be implemented by subclasses")
+
+    def snapshot(self, cols, rows, format="text", out=None):
+        """Renders the UI at the given size without a terminal, as "text",
+        "ansi" or "html" (see 'Snapshot'). The result is written row by row
+        to 'out' (a file-like object) when given, and returned as a string
+        otherwise. Use 'HTMLSnapshot(ui._palette).css()' to get the
+        stylesheet for the HTML output."""
+        if format not in SNAPSHOTS:
+            raise UIRuntimeError("Unsupported snapshot format: " + repr(format))
+        renderer = SNAPSHOTS[format](self._palette)
+        buffer = io.StringIO() if out is None else out
+        for _ in renderer.render(self.render((cols, rows))):
+            buffer.write(_)
+        return buffer.getvalue() if out is None else None
+
+    # WIDGET LIFECYCLE
+    # -------------------------------------------------------------------------
+
+    def _roots(self):
+        """Returns the top-level widgets of the UI."""
+        return [_ for _ in (self._header, self._listbox) if _]
+
+    def _subtrees(self):
+        """Returns the '(name, widget)' subtrees of the UI, which are the
+        header and each of the top-level widgets."""
+        res = [("header", self._header)] if self._header else []
+        for i, widget in enumerate(widget_children(self._listbox) if self._listbox else ()):
+            res.append((self._subtreeName(widget) or "%d:%s" % (i, widget.__class__.__name__), widget))
+        return res
+
+    def _subtreeName(self, widget):
+        """Returns the first id found in the given subtree, if any."""
+        stack = [widget]
+        while stack:
+            widget = stack.pop(0)
+            name = widget_meta(widget, "id")
+            if name:
+                return name
+            stack.extend(widget_children(widget))
+        return None
+
+    def _findParent(self, widget):
+        """Returns the container of the given widget within the UI, or 'None'
+        if the widget is not part of the UI."""
+        stack = list(self._roots())
+        while stack:
+            parent = stack.pop()
+            for child in widget_children(parent):
+                if child is widget:
+                    return parent
+                stack.append(child)
+        return None
+
+    def destroy(self, widget):
+        """Removes the given widget (or the widget with the given id) and its
+        subtree from its container, together with the decorations that wrap
+        it (style, cache), and releases their ids, group memberships and event
+        handlers, so that they can be garbage collected and their ids reused.
+        Returns the removed widget."""
+        if type(widget) in (str,):
+            widget = getattr(self.widgets, widget)
+        parent = self._findParent(widget)
+        while isinstance(parent, urwid.WidgetDecoration):
+            widget = parent
+            parent = self._findParent(widget)
+        if isinstance(parent, urwid.ListBox):
+            parent.body.remove(widget)
+        elif isinstance(parent, urwid.Frame):
+            if parent.body is widget:
+                raise UIRuntimeError("Cannot destroy the body of a frame")
+            elif parent.header is widget:
+                parent.header = None
             else:
-                try:
-                    res = self._handle("keyPress", topwidget, key)
-                except UIRuntimeError:
-                    res = False
-            if res is False:
-                topwidget.keypress(self._currentSize, key)
+                parent.footer = None
+        elif parent is not None:
+            for i, item in enumerate(parent.contents):
+                if item[0] is widget:
+                    del parent.contents[i]
+                    break
+        self._release(widget)
+        return widget
 
-    def getFocused(self):
-        raise Exception("Must be implemented by subclasses")
+    def _release(self, widget):
+        """Releases the ids, group memberships and event handlers of the
+        widgets in the given subtree, and closes its pagers."""
+        stack = [widget]
+        while stack:
+            widget = stack.pop()
+            name = widget_meta(widget, "id")
+            if name and self._widgets.get(name) is widget:
+                del self._widgets[name]
+            if isinstance(widget, urwid.RadioButton):
+                for name, group in list(self._groups.items()):
+                    if widget in group:
+                        group.remove(widget)
+                        if not group:
+                            del self._groups[name]
+            METADATA.pop(widget, None)
+            self._static.discard(widget)
+            if isinstance(widget, Pager):
+                widget.close()
+            stack.extend(widget_children(widget))
+
+    def replace(self, name, text):
+        """Replaces the content of the 'Dyn' region with the given id by the
+        widgets of the given UI text (see 'parseFragment'), in a single
+        update of the region. The fragment is parsed first, so that the region
+        is left as it was when it has an error, and the ids, groups and
+        handlers of the previous widgets are then released (see 'destroy'),
+        the fragment taking over their ids. Returns the new widgets."""
+        region = getattr(self.widgets, name)
+        if not isinstance(region, urwid.Pile):
+            raise UIRuntimeError("Not a Dyn region: " + name)
+        ids = dict(self._widgets)
+        groups = dict((k, list(v)) for k, v in self._groups.items())
+        previous = widget_children(region)
+        stack = list(previous)
+        while stack:
+            widget = stack.pop()
+            name = widget_meta(widget, "id")
+            if name and ids.get(name) is widget:
+                del self._widgets[name]
+            stack.extend(widget_children(widget))
+        try:
+            widgets = self.parseFragment(text)
+        except Exception:
+            # We restore the previous ids, and unregister what the fragment
+            # registered before its error
+            self._widgets.clear()
+            self._widgets.update(ids)
+            for k in [_ for _ in self._groups if _ not in groups]:
+                del self._groups[k]
+            for k, v in groups.items():
+                self._groups[k][:] = v
+            raise
+        for widget in previous:
+            self._release(widget)
+        replace_contents(region, widgets)
+        return widgets
+
+    def memoryReport(self):
+        """Returns the widgets retained by the UI, as a dict with the number of
+        'widgets' and their estimated size in 'bytes' (see 'widget_size'),
+        the same for each subtree (the header, each top-level widget and, for
+        a console, the footer and each dialog) in 'subtrees', and the number
+        of registered 'ids', 'groups', 'static' widgets and 'timers'."""
+        subtrees = []
+        count = size = 0
+        for name, widget in self._subtrees():
+            c, b = widget_size(widget)
+            subtrees.append((name, c, b))
+            count += c
+            size += b
+        return {
+            "widgets": count,
+            "bytes": size,
+            "subtrees": subtrees,
+            "ids": len(self._widgets),
+            "groups": len(self._groups),
+            "static": len(self._static),
+            "meters": len(self._meters),
+            "timers": len(self._timers),
+        }
 
     def focusNext(self):
         raise Exception("Must be implemented by subclasses")
@@ -499,6 +2640,8 @@ class UI:
     def isEditable(self, widget):
         if isinstance(widget, urwid.Edit):
             return True
+        elif isinstance(widget, DocEdit):
+            return True
         elif isinstance(widget, urwid.IntEdit):
             return True
         else:
@@ -507,6 +2650,12 @@ class UI:
     def isFocusable(self, widget):
         if isinstance(widget, urwid.Edit):
             return True
+        elif isinstance(widget, DocEdit):
+            return True
+        elif isinstance(widget, Pager):
+            return True
+        elif isinstance(widget, TileGrid):
+            return True
         elif isinstance(widget, urwid.IntEdit):
             return True
         elif isinstance(widget, urwid.Button):
@@ -558,21 +2707,286 @@ class UI:
         return self
 
     def parseUI(self, text):
-        """Parses the given text and initializes this user interface object."""
-        text = string.Template(text).substitute(self._strings)
+        """Parses the given text and initializes this user interface object.
+        The containers below the first 'DEFER_AFTER' widgets are only built
+        when they are first needed (see 'DeferredWidget'), or in the
+        background when the UI is 'progressive'."""
+        started = time.perf_counter()
         self._content = []
         self._stack = []
-        self._currentLine = 0
-        for line in text.split("\n"):
-            line = line.strip()
-            if not line.startswith("#"):
-                self._parseLine(line)
-            self._currentLine += 1
+        self._deferring = self.DEFER_AFTER is not None
+        try:
+            self._parseLines(text)
+        finally:
+            self._deferring = False
+        self.stats.sample("build", time.perf_counter() - started)
         self._listbox = self._createWidget(urwid.ListBox, self._content)
         return self._content
 
+    def parseFragment(self, text):
+        """Parses the given UI text (with the current palette and strings)
+        and returns its top-level widgets, leaving the rest of the UI as it
+        is (see 'replace')."""
+        state = (self._content, self._stack, self._currentLine)
+        self._content = []
+        self._stack = []
+        try:
+            self._parseLines(text)
+            if self._stack:
+                raise UISyntaxError("Missing End in fragment")
+            return self._content
+        finally:
+            self._content, self._stack, self._currentLine = state
+
+    # Compiled UI texts, shared by all the UIs of the process
+    FRAGMENTS = {}
+
+    def _compile(self, text):
+        """Returns the lines of the given UI text as a list of '(line number,
+        parser, data)', where the parser is the name of the method that parses
+        the line, or 'None' for blank lines."""
+        key = (self.__class__, text)
+        res = self.FRAGMENTS.get(key)
+        if res is not None:
+            return res
+        res = []
+        for i, line in enumerate(text.split("\n")):
+            line = line.strip()
+            if line.startswith("#"):
+                continue
+            elif not line:
+                res.append((i, None, None))
+                continue
+            match = self.RE_LINE.match(line)
+            if not match:
+                raise UISyntaxError("Unrecognized line: " + line)
+            name = match.group(1)
+            if hasattr(self, "_parse" + name):
+                res.append((i, "_parse" + name, line[match.end() :]))
+            elif name[0] == name[1] == name[2]:
+                res.append((i, "_parseDvd", name + line[match.end() :]))
+            else:
+                raise UISyntaxError("Unrecognized widget: `" + name + "`")
+        if len(self.FRAGMENTS) > 1024:
+            self.FRAGMENTS.clear()
+        self.FRAGMENTS[key] = res
+        return res
+
+    def _parseLines(self, text):
+        """Parses the lines of the given UI text, adding their widgets to the
+        current content."""
+        text = string.Template(text).substitute(self._strings)
+        self._parseCompiled(self._compile(text))
+
+    def _parseCompiled(self, lines):
+        """Parses the given compiled lines (see '_compile'), deferring the
+        containers that can be (see '_deferrable')."""
+        i = 0
+        while i < len(lines):
+            self._currentLine, parser, data = lines[i]
+            if self._progressive and self._isBelowFold():
+                self._buildLater(lines[i:])
+                return
+            end = self._deferrable(lines, i) if parser in self.DEFERRED else None
+            if end:
+                self._add(self._defer(lines[i:end]))
+                i = end
+                continue
+            elif parser:
+                getattr(self, parser)(data)
+            else:
+                self._add(self.BLANK)
+            i += 1
+
+    # The number of top-level widgets after which the containers are deferred,
+    # as they are likely to be below the fold
+    # The number of top-level widgets after which containers are deferred,
+    # 'None' building the whole UI right away
+    DEFER_AFTER = 24
+    # The parsers of the lines that start a container, the ones that can be
+    # deferred, and the ones that prevent their container from being deferred
+    CONTAINERS = ("_parseBox", "_parsePle", "_parseCol", "_parseGFl", "_parseLBx")
+    DEFERRED = ("_parseBox", "_parsePle", "_parseLBx")
+    UNDEFERRED = ("_parseKey", "_parseFtr")
+
+    def _deferrable(self, lines, start):
+        """Returns the index of the line after the 'End' of the container
+        starting at the given line if it can be deferred, that is if it is a
+        top-level container after the first 'DEFER_AFTER' widgets of the UI,
+        with no key bindings. Errors in the arguments of a deferred container
+        are only raised when it is built."""
+        if not self._isBelowFold():
+            return None
+        depth = 0
+        for i in range(start, len(lines)):
+            parser = lines[i][1]
+            if parser in self.CONTAINERS:
+                depth += 1
+            elif parser in self.UNDEFERRED:
+                return None
+            elif parser == "_parseEnd":
+                depth -= 1
+                if not depth:
+                    return i + 1
+        return None
+
+    def _isBelowFold(self):
+        """Tells if the line being parsed is a top-level one that comes after
+        the first 'DEFER_AFTER' widgets of the UI."""
+        return (
+            self._deferring
+            and not self._stack
+            and len(self._content) >= self.DEFER_AFTER
+        )
+
+    def _itemEnd(self, lines, start):
+        """Returns the index of the line after the top-level item (a widget
+        or a whole container) starting at the given line."""
+        depth = 0
+        for i in range(start, len(lines)):
+            parser = lines[i][1]
+            if parser in self.CONTAINERS:
+                depth += 1
+            elif parser == "_parseEnd":
+                depth -= 1
+            if depth <= 0:
+                return i + 1
+        return len(lines)
+
+    def _defer(self, lines):
+        """Returns a 'DeferredWidget' for the container of the given lines."""
+        widget = DeferredWidget(functools.partial(self._buildContainer, lines))
+        self._deferred.append((weakref.ref(widget), lines))
+        return widget
+
+    def _build(self, lines):
+        """Parses the given compiled lines on their own, and returns their
+        top-level widgets."""
+        state = (self._content, self._stack, self._currentLine)
+        self._content = []
+        self._stack = []
+        try:
+            self._parseCompiled(lines)
+            return self._content
+        finally:
+            self._content, self._stack, self._currentLine = state
+
+    def _buildContainer(self, lines):
+        return self._build(lines)[0]
+
+    def _buildWidget(self, name):
+        self._buildMatching(re.compile("#%s(?![\\w\\-])" % re.escape(name)))
+
+    def _buildGroup(self, name):
+        self._buildMatching(re.compile(":\\s*%s\\s*\\]" % re.escape(name)))
+
+    def _buildMatching(self, regexp):
+        """Builds the deferred containers and the pending items of a
+        progressive UI (see 'progressive') that have a line matching the
+        given regexp, so that the ids and groups they define are registered
+        when they are looked up."""
+        deferred = []
+        for ref, lines in self._deferred:
+            widget = ref()
+            if widget is None or widget.isBuilt():
+                continue
+            elif any(regexp.search(_[2]) for _ in lines if _[2]):
+                widget.original_widget
+                self.stats.count("build.forced")
+            else:
+                deferred.append((ref, lines))
+        self._deferred = deferred
+        lines, i = self._pending, self._pendingAt
+        while lines and i < len(lines):
+            end = self._itemEnd(lines, i)
+            if i in self._prebuilt:
+                end = self._prebuilt[i][0]
+            elif any(regexp.search(_[2]) for _ in lines[i:end] if _[2]):
+                self._prebuilt[i] = (end, self._build(lines[i:end]))
+                self.stats.count("build.forced")
+            i = end
+
+    # PROGRESSIVE BUILD
+    # -------------------------------------------------------------------------
+
+    # The time (in seconds) spent building a progressive UI at each step
+    BUILD_SLICE = 0.005
+    PLACEHOLDER = "…"
+
+    def progressive(self, enabled=None):
+        """Sets/Gets whether the UI is built progressively, which must be
+        set before 'parseUI'. Only the first 'DEFER_AFTER' top-level
+        widgets are then built by 'parseUI', so that the first frame can be
+        drawn right away. The others are built by the timers of the event
+        loop in slices of 'BUILD_SLICE' seconds, and appear after a
+        placeholder until then. Looking up an id (or a group) that is not
+        built yet builds the widget that defines it (see '_buildMatching')."""
+        if enabled is None:
+            return self._progressive
+        else:
+            self._progressive = enabled
+
+    def isBuilt(self):
+        """Tells if all the widgets of a progressive UI are built."""
+        return self._pending is None
+
+    def _buildLater(self, lines):
+        """Leaves the given top-level lines to be built by '_buildSlice',
+        after a placeholder. The key bindings and footer they define are
+        parsed right away, as they do not depend on the widgets."""
+        pending = []
+        for line in lines:
+            if line[1] in self.UNDEFERRED:
+                self._currentLine = line[0]
+                getattr(self, line[1])(line[2])
+            else:
+                pending.append(line)
+        self._pending, self._pendingAt, self._prebuilt = pending, 0, {}
+        self._placeholder = self._styleWidget(
+            urwid.Text(self.PLACEHOLDER), {"style": "placeholder"}
+        )
+        self._add(self._placeholder)
+        self.after(0, self._buildSlice)
+
+    def _buildSlice(self):
+        """Builds the pending top-level widgets for 'BUILD_SLICE' seconds,
+        and inserts them before the placeholder, until they are all built."""
+        if self._pending is None:
+            return
+        started = time.perf_counter()
+        lines, i, widgets = self._pending, self._pendingAt, []
+        while i < len(lines) and time.perf_counter() - started < self.BUILD_SLICE:
+            end, built = self._prebuilt.pop(i, (None, None))
+            if end is None:
+                end = self._itemEnd(lines, i)
+                built = self._build(lines[i:end])
+            widgets.extend(built)
+            i = end
+        self._pendingAt = i
+        body = container_contents(self._listbox)
+        index = len(body)
+        for j in range(len(body) - 1, -1, -1):
+            if body[j] is self._placeholder:
+                index = j
+                break
+        if i < len(lines):
+            splice_contents(self._listbox, index, index, widgets)
+            self.after(0, self._buildSlice)
+        else:
+            splice_contents(self._listbox, index, index + 1, widgets)
+            self._pending = self._placeholder = None
+            self._prebuilt = {}
+        self.stats.sample("build.slice", time.perf_counter() - started)
+
+    # Parsed styles and attributes, shared by all the UIs of the process
+    PALETTES = {}
+    ATTRIBUTES = SizeCache(4096)
+
     def parseStyle(self, data):
         """Parses the given style."""
+        if data in self.PALETTES:
+            self._palette = list(self.PALETTES[data])
+            return self._palette
         res = []
         for line in data.split("\n"):
             if not line.strip():
@@ -589,6 +3003,7 @@ class UI:
             if not len(res_line) == 4:
                 raise UISyntaxError("Expected NAME: FOREGROUND BACKGROUND FONT")
             res.append(tuple(res_line))
+        self.PALETTES[data] = tuple(res)
         self._palette = res
         return res
 
@@ -614,11 +3029,22 @@ class UI:
 
     def _parseAttributes(self, data):
         assert type(data) in (str,)
-        ui_attrs, data = self._parseUIAttributes(data)
-        args, kwargs = self._parseArguments(data)
-        return ui_attrs, args, kwargs
-
-    RE_UI_ATTRIBUTE = re.compile("\s*([#@\?\:]|\&[\w]+\=)([\w\d_\-]+)\s*")
+        parsed = self.ATTRIBUTES.get(data)
+        if parsed is None:
+            ui_attrs, rest = self._parseUIAttributes(data)
+            args, kwargs = self._parseArguments(rest)
+            shared = is_immutable(args) and is_immutable(tuple(kwargs.values()))
+            parsed = self.ATTRIBUTES.put(data, (ui_attrs, args, kwargs, shared))
+        # The parsers update what they get, so they get copies, and the
+        # widgets must not share mutable arguments (such as lists) between UIs
+        ui_attrs, args, kwargs, shared = parsed
+        if not shared:
+            args, kwargs = copy.deepcopy((args, kwargs))
+        return dict(ui_attrs, events=dict(ui_attrs["events"])), args, dict(kwargs)
+
+    RE_UI_ATTRIBUTE = re.compile(
+        "\s*([#@\?\:]|\&[\w]+\=)([\w\d_\-]+(?:[~\^][\d\.]+m?s)?)\s*"
+    )
 
     def _parseUIAttributes(self, data):
         """Parses the given UI attributes from the data and returns the rest of
@@ -681,13 +3107,60 @@ class UI:
         styles.append(widget.__class__.__name__)
         unf_styles = [_ for _ in styles if self.hasStyle(_)]
         foc_styles = [_ + "*" for _ in styles if self.hasStyle(_ + "*")]
-        if unf_styles:
-            if foc_styles:
-                return urwid.AttrWrap(widget, unf_styles[0], foc_styles[0])
-            else:
-                return urwid.AttrWrap(widget, unf_styles[0])
-        else:
+        if not unf_styles:
             return widget
+        focus = foc_styles[0] if foc_styles else None
+        # A widget that is already wrapped gets the style merged in its
+        # wrapper, rather than another wrapper on top of it.
+        if type(widget) in ATTRIBUTE_WRAPPERS:
+            return merge_attributes(widget, unf_styles[0], focus)
+        else:
+            return urwid.AttrWrap(widget, unf_styles[0], focus)
+
+    STATIC_WIDGETS = (urwid.Text, urwid.Divider)
+    STATIC_CONTAINERS = (urwid.Pile, urwid.Columns, urwid.GridFlow, urwid.Padding)
+
+    def _isStatic(self, widget, ui):
+        """Tells if the given widget is static, that is if it has no id, no
+        events, no info/tooltip and is either a text/divider or a container
+        with only static children. The canvases of static widgets do not
+        change, and can be cached (see 'CachedWidget')."""
+        if ui and (
+            ui.get("id") or ui.get("events") or ui.get("info") or ui.get("tooltip")
+        ):
+            return False
+        elif type(widget) in self.STATIC_WIDGETS:
+            return True
+        elif type(widget) in self.STATIC_CONTAINERS:
+            children = widget_children(widget)
+            return bool(children) and all(
+                isinstance(_, CachedWidget) or _ is self.BLANK or _ is self.EMPTY
+                for _ in children
+            )
+        else:
+            return False
+
+    def _makeStatic(self, widget, base):
+        """Wraps the given (styled) static 'widget' in a 'CachedWidget'. The
+        children of the 'base' widget that were themselves cached are
+        unwrapped, as the canvas of the whole subtree is now cached."""
+        if isinstance(base, urwid.Padding):
+            if isinstance(base.original_widget, CachedWidget):
+                base.original_widget = base.original_widget.original_widget
+        elif not isinstance(base, self.STATIC_WIDGETS):
+            contents = base.contents
+            for i, (child, options) in enumerate(contents):
+                if isinstance(child, CachedWidget):
+                    contents[i] = (child.original_widget, options)
+        res = CachedWidget(widget, self.stats)
+        self._static.add(res)
+        return res
+
+    def invalidateStatic(self):
+        """Clears the canvases cached for the static widgets, which is
+        required when the screen is resized."""
+        for _ in list(self._static):
+            _.invalidate()
 
     def _createWidget(self, widgetClass, *args, **kwargs):
         """Creates the given widget by instanciating @widgetClass with the given
@@ -737,34 +3210,37 @@ class UI:
             _ui = {}
         if "id" in _ui:
             setattr(self.widgets, _ui["id"], widget)
-            widget._urwideId = _ui["id"]
+            set_widget_meta(widget, "id", _ui["id"])
         if _ui.get("events"):
             for event, handler in _ui["events"].items():
+                handler = self._parseEvent(event, handler)
                 if event == "press":
-                    if not isinstance(widget, urwid.Button) and not isinstance(
-                        widget, urwid.RadioButton
+                    if not isinstance(
+                        widget, (urwid.Button, urwid.RadioButton, TileGrid)
                     ):
                         raise UISyntaxError(
                             "Press event only applicable to Button: " + repr(widget)
                         )
-                    widget._urwideOnPress = handler
+                    set_widget_meta(widget, "onPress", handler)
                 elif event == "edit":
-                    if not isinstance(widget, urwid.Edit):
+                    if not isinstance(widget, (urwid.Edit, DocEdit)):
                         raise UISyntaxError(
                             "Edit event only applicable to Edit: " + repr(widget)
                         )
-                    widget._urwideOnEdit = handler
+                    set_widget_meta(widget, "onEdit", handler)
                 elif event == "focus":
-                    widget._urwideOnFocus = handler
+                    set_widget_meta(widget, "onFocus", handler)
                 elif event == "key":
-                    widget._urwideOnKey = handler
+                    set_widget_meta(widget, "onKey", handler)
                 else:
                     raise UISyntaxError("Unknown event type: " + event)
         if _ui.get("info"):
-            widget._urwideInfo = _ui["info"]
+            set_widget_meta(widget, "info", _ui["info"])
         if _ui.get("tooltip"):
-            widget._urwideTooltip = _ui["tooltip"]
+            set_widget_meta(widget, "tooltip", _ui["tooltip"])
         res = self._styleWidget(widget, _ui)
+        if self._isStatic(widget, _ui):
+            res = self._makeStatic(res, widget)
         return res
 
     # WIDGET-SPECIFIC METHODS
@@ -850,8 +3326,20 @@ class UI:
             else:
                 w = self._createWidget(urwid.Pile, content)
             border = kwargs.get("border") or 1
+            left = right = border
+            # A box that only contains a box is folded into a single padding,
+            # the styles of both paddings being the same.
+            inner = w.original_widget if type(w) in ATTRIBUTE_WRAPPERS else w
+            if (
+                type(inner) is urwid.Padding
+                and inner.align == LEFT
+                and inner.width == RELATIVE_100
+            ):
+                w = inner.original_widget
+                left += inner.left
+                right += inner.right
             w = self._createWidget(
-                urwid.Padding, w, ("fixed left", border), ("fixed right", border)
+                urwid.Padding, w, ("fixed left", left), ("fixed right", right)
             )
             # TODO: Filler does not work
             # w = self._createWidget(urwid.Filler, w, ('fixed top', border), ('fixed bottom', border) )
@@ -883,6 +3371,93 @@ class UI:
                 )
             )
 
+    RE_DOC = re.compile("\s*\[([^\]]*)\]")
+
+    def _parseDoc(self, data):
+        """Parses a 'Doc [text] height=10' line, which is a 'DocEdit' given
+        the height in rows (10 by default)."""
+        match = self.RE_DOC.match(data)
+        text = ""
+        if match:
+            text = match.group(1)
+            data = data[match.end() :]
+        ui, args, kwargs = self._parseAttributes(data)
+        height = kwargs.pop("height", 10)
+        widget = self._createWidget(DocEdit, text, ui=ui, args=args, kwargs=kwargs)
+        self._add(urwid.BoxAdapter(widget, height))
+
+    # The delay between the steps of the indexing of the pagers
+    PAGER_INDEX_DELAY = 0.01
+
+    def _parsePgr(self, data):
+        """Parses a 'Pgr path="...", height=10' line, which is a 'Pager' of
+        the given file and height in rows (10 by default). The file is
+        indexed in the background, by the timers of the event loop."""
+        ui, args, kwargs = self._parseAttributes(data)
+        height = kwargs.pop("height", 10)
+        widget = self._createWidget(Pager, ui=ui, args=args, kwargs=kwargs)
+        self._add(urwid.BoxAdapter(widget, height))
+        self.after(self.PAGER_INDEX_DELAY, self._indexPager, self.unwrap(widget))
+
+    def _indexPager(self, pager):
+        if pager.data and pager.index():
+            self.after(self.PAGER_INDEX_DELAY, self._indexPager, pager)
+
+    # The delay between the refreshes of the meters, which caps the rate at
+    # which they are redrawn, however often their series are fed. A refresh
+    # is only scheduled when a series gets samples.
+    METER_DELAY = 1.0 / 25
+
+    def _parsePrg(self, data):
+        """Parses a 'Prg label="...", low=0, high=100' line, which is a
+        'Progress' bar of its series (see 'Meter')."""
+        self._parseMeter(Progress, data)
+
+    def _parseGge(self, data):
+        """Parses a 'Gge label="...", low=0, high=100, value_format="%.1f"' line,
+        which is a 'Gauge' of its series."""
+        self._parseMeter(Gauge, data)
+
+    def _parseSpk(self, data):
+        """Parses a 'Spk label="...", capacity=1024' line, which is a
+        'Sparkline' of its series."""
+        self._parseMeter(Sparkline, data)
+
+    def _parseMeter(self, meterClass, data):
+        ui, args, kwargs = self._parseAttributes(data)
+        widget = self._createWidget(meterClass, ui=ui, args=args, kwargs=kwargs)
+        meter = self.unwrap(widget)
+        self._meters.add(meter)
+        meter.series.watch(self._meterChanged)
+        self._add(widget)
+
+    def _meterChanged(self):
+        """Schedules a refresh of the meters, unless one is pending."""
+        if not self._meterTimer:
+            self._meterTimer = self.after(self.METER_DELAY, self._refreshMeters)
+
+    def _refreshMeters(self):
+        self._meterTimer = None
+        for meter in list(self._meters):
+            meter.refresh()
+
+    def _parseGrd(self, data):
+        """Parses a 'Grd cell_width=10, height=10' line, which is a 'TileGrid'
+        given the height in rows (10 by default). Its items are given with
+        'items=[...]' or with 'setItems', and its tiles use the 'tile' and
+        'tile*' styles."""
+        ui, args, kwargs = self._parseAttributes(data)
+        height = kwargs.pop("height", 10)
+        if self.hasStyle("tile"):
+            kwargs.setdefault("attr", "tile")
+        if self.hasStyle("tile*"):
+            kwargs.setdefault("focus_attr", "tile*")
+        # A grid with no press event only navigates
+        if "press" in ui["events"]:
+            kwargs.setdefault("on_press", self._doPress)
+        widget = self._createWidget(TileGrid, ui=ui, args=args, kwargs=kwargs)
+        self._add(urwid.BoxAdapter(widget, height))
+
     def _parsePle(self, data):
         def end(content, ui=None, **kwargs):
             if not content:
@@ -904,12 +3479,11 @@ class UI:
     def _parseGFl(self, data):
         def end(content, ui=None, **kwargs):
             max_width = 0
-            # Gets the maximum width for the content
+            # Gets the maximum width (in cells) for the content
             for widget in content:
-                if hasattr(widget, "get_text"):
-                    max_width = max(len(widget.get_text()), max_width)
-                if hasattr(widget, "get_label"):
-                    max_width = max(len(widget.get_label()), max_width)
+                text = METRICS.text(widget)
+                if text:
+                    max_width = max(METRICS.width(text), max_width)
             kwargs.setdefault("cell_width", max_width + 4)
             kwargs.setdefault("h_sep", 1)
             kwargs.setdefault("v_sep", 1)
@@ -926,6 +3500,26 @@ class UI:
         ui, args, kwargs = self._parseAttributes(data)
         self._push(end, ui=ui, args=args, kwargs=kwargs)
 
+    RE_KEY = re.compile("^([^&#]*)(.*)$")
+
+    def _parseKey(self, data):
+        """Parses a key binding line such as `Key ctrl x, ctrl s &press=save`,
+        binding the key sequence to the event of the first '&' attribute."""
+        keys, data = self.RE_KEY.match(data).groups()
+        ui, data = self._parseUIAttributes(data)
+        if not ui["events"] or data.strip():
+            raise UISyntaxError("Key expects KEYS &press=EVENT: " + repr(keys + data))
+        self._keymaps[0].bind(keys, list(ui["events"].values())[0])
+        self._keys = None
+
+    def _parseDyn(self, data):
+        """Parses a 'Dyn #name' line, which is an empty region whose content
+        is given later with 'replace'."""
+        ui, args, kwargs = self._parseAttributes(data)
+        if "id" not in ui:
+            raise UISyntaxError("Dyn requires an id: " + repr(data))
+        self._add(self._createWidget(urwid.Pile, [], ui=ui, args=args, kwargs=kwargs))
+
     def _parseEnd(self, data):
         if data.strip():
             raise UISyntaxError("End takes no argument: " + repr(data))
@@ -948,6 +3542,13 @@ class Console(UI):
     """The console class allows to create console applications that work 'full
     screen' within a terminal."""
 
+    # The delay (in seconds) for which the resizes are debounced: the screen
+    # is only drawn again once its size stopped changing for that long
+    RESIZE_DELAY = 0.05
+    # The number of screen sizes for which the canvases are kept alive, so
+    # that going back to one of them reuses the layout
+    LAYOUT_SIZES = 4
+
     def __init__(self):
         UI.__init__(self)
         self._ui = None
@@ -955,10 +3556,24 @@ class Console(UI):
         self._header = None
         self._footer = None
         self._listbox = None
-        self._dialog = None
+        self._dialogs = []
+        self._layers = None
+        self._footerState = None
+        self._focused = None
+        self._inputWait = None
+        self._recorder = None
+        self._canvas = None
+        self._canvases = SizeCache(self.LAYOUT_SIZES)
+        self._resizeTimer = None
+        self._drawn = None
+        self._focus = None
         self._tooltiptext = ""
         self._infotext = ""
         self._footertext = ""
+        self._hud = False
+        self._hudText = urwid.Text("")
+        self._hudWidget = None
+        self._hudTimer = None
         self.isRunning = False
         self.endMessage = ""
         self.endStatus = 1
@@ -987,35 +3602,99 @@ class Console(UI):
         else:
             self._footertext = ensureString(text)
 
-    def dialog(self, dialog):
-        """Sets the dialog as this UI dialog. All events will be forwarded to
+    # The delay between the refreshes of the statistics in the footer
+    HUD_DELAY = 0.5
+
+    def hud(self, enabled=None):
+        """Sets/Gets whether the statistics (see 'UI.stats') are displayed
+        in the footer, where they are refreshed every 'HUD_DELAY' seconds."""
+        if enabled is None:
+            return self._hud
+        else:
+            self._hud = enabled
+            if self._hudTimer:
+                self.cancel(self._hudTimer)
+                self._hudTimer = None
+            if enabled:
+                self._refreshHud()
+
+    def _refreshHud(self):
+        """Updates the text of the statistics in the footer, which is only
+        invalidated when they changed."""
+        text = str(self.stats)
+        if text != self._hudText.text:
+            self._hudText.set_text(text)
+        self._hudTimer = self.after(self.HUD_DELAY, self._refreshHud)
+
+    def dialog(self, dialog=None):
+        """Sets/Gets the current dialog. Setting a dialog pushes it on top of
+        the dialogs stack (see 'pushDialog'): all events will be forwarded to
         the dialog until exit."""
-        self._dialog = dialog
+        if dialog is None:
+            return self._dialogs[-1] if self._dialogs else None
+        else:
+            self.pushDialog(dialog)
+
+    def pushDialog(self, dialog):
+        """Pushes the given dialog on top of the dialogs stack. Only the
+        dialog on top of the stack receives the keys."""
+        self._dialogs.append(dialog)
+
+    def popDialog(self, dialog=None):
+        """Removes the given dialog (the top one by default) from the dialogs
+        stack."""
+        if dialog is None:
+            return self._dialogs.pop() if self._dialogs else None
+        elif dialog in self._dialogs:
+            self._dialogs.remove(dialog)
+        return dialog
+
+    def _keymap(self):
+        # The console bindings are disabled while a dialog is displayed, the
+        # dialog has its own bindings.
+        return {} if self._dialogs else UI._keymap(self)
+
+    def invalidateLayers(self):
+        """Discards the cached canvas of the layers displayed below the top
+        dialog. This happens automatically when the dialogs stack changes, on
+        resize or when URWID invalidates any of the lower layers widgets."""
+        self._layers = None
+
+    def _roots(self):
+        return [self._frame] if self._frame else UI._roots(self)
+
+    def _subtrees(self):
+        res = UI._subtrees(self)
+        if self._footer:
+            res.append(("footer", self._footer))
+        for i, dialog in enumerate(self._dialogs):
+            res.append(("dialog:%d" % (i), dialog.view()))
+        return res
+
+    def destroy(self, widget):
+        widget = UI.destroy(self, widget)
+        self._focused = self._focus = self._route = None
+        self.invalidateLayers()
+        return widget
 
     # WIDGET INFORMATION
     # -------------------------------------------------------------------------
 
     def getFocused(self):
-        """Gets the focused widget"""
-        # We get the original widget to focus on
-        focused = original_widget(self._listbox.get_focus()[0])
-        old_focused = None
-        while focused != old_focused:
-            old_focused = focused
-            # There are some types that are not focuable
-            if isinstance(focused, urwid.AttrWrap):
-                if focused.w:
-                    focused = focused.w
-            elif isinstance(focused, urwid.Padding):
-                if focused.min_width:
-                    focused = focused.min_width
-            elif isinstance(focused, urwid.Filler):
-                if focused.w:
-                    focused = focused.w
-            elif hasattr(focused, "get_focus"):
-                if focused.get_focus():
-                    focused = focused.get_focus()
-        return focused
+        """Gets the focused widget. It is kept until the console is modified
+        (see 'isModified'), so that it is looked up once per focus change."""
+        if self._focus is None or self.isModified():
+            self._focus = [focused_widget(self._listbox.get_focus()[0])]
+        return self._focus[0]
+
+    def isModified(self):
+        """Tells if URWID invalidated the canvas of the last frame, which is
+        the case as soon as any widget on screen changes, including the
+        focus of any container."""
+        if not self._drawn:
+            return True
+        widget, size = self._drawn
+        return not CanvasWidget.isCached(widget, size, self._canvas, True)
 
     def focusNext(self):
         focused = self._listbox.get_focus()[1] + 1
@@ -1043,8 +3722,8 @@ class Console(UI):
     def getToplevel(self):
         """Returns the toplevel widget, which may be a dialog's view, if there
         was a dialog."""
-        if self._dialog:
-            return self._dialog.view()
+        if self._dialogs:
+            return self._dialogs[-1].view()
         else:
             return self._frame
 
@@ -1055,19 +3734,24 @@ class Console(UI):
     # URWID EVENT-LOOP
     # -------------------------------------------------------------------------
 
-    def main(self):
+    def main(self, screen=None):
         """This is the main event-loop. That is what you should invoke to start
-        your application."""
-        # self._ui = urwid.curses_display.Screen()
-        self._ui = urwid.raw_display.Screen()
+        your application. The console is displayed on the terminal, unless
+        another 'screen' is given (such as a 'WebScreen')."""
+        self._ui = screen or urwid.raw_display.Screen()
+        if hasattr(self._ui, "stats"):
+            self._ui.stats = self.stats
         self._ui.clear()
         if self._palette:
             self._ui.register_palette(self._palette)
         self._ui.run_wrapper(self.run)
         # We clear the screen (I know, I should use URWID, but that was the
         # quickest way I found)
-        curses.setupterm()
-        sys.stdout.write(curses.tigetstr("clear"))
+        if not screen:
+            import curses
+
+            curses.setupterm()
+            sys.stdout.write(curses.tigetstr("clear").decode())
         if self.endMessage:
             print(self.endMessage)
         return self.endStatus
@@ -1077,10 +3761,22 @@ class Console(UI):
         use the 'main' function instead."""
         # self._ui.set_mouse_tracking()
         self._currentSize = self._ui.get_cols_rows()
+        if self._recorder:
+            self._recorder.start(self._currentSize)
         self.isRunning = True
-        while self.isRunning:
-            self._currentSize = self._ui.get_cols_rows()
-            self.loop()
+        try:
+            while self.isRunning:
+                self.loop()
+        finally:
+            if self._recorder:
+                self._recorder.close()
+                self._recorder = None
+
+    def record(self, path):
+        """Records the session (keys, resizes and frame times) to the file at
+        the given path, which can be replayed with a 'Replayer'. This must be
+        called before 'main'."""
+        self._recorder = Recorder(path)
 
     def end(self, msg=None, status=1):
         """Ends the application, registering the given 'msg' as end message, and
@@ -1092,29 +3788,52 @@ class Console(UI):
     def loop(self):
         """This is the main URWID loop, where the event processing and
         dispatching is done."""
+        frame = self.drawFrame()
+        # And process keys
+        if not self.isRunning:
+            return
+        # The timers are run with the keys, right before the next frame
+        self._setInputWait(self._timerWait())
+        keys = self._ui.get_input()
+        self.processKeys(frame, keys)
+
+    def drawFrame(self):
+        """Updates the focus and draws the screen, returning the state of the
+        frame to be given to 'processKeys' with the next input. The 'loop'
+        calls both, but they can be called separately when the input comes
+        from somewhere else (see 'Session')."""
         # We get the focused element, and update the info and and tooltip
-        if self._dialog:
-            focused = self._dialog.view()
+        t_start = time.perf_counter()
+        if self._dialogs:
+            focused = self._dialogs[-1].view()
         else:
             focused = self.getFocused() or self._frame
-        # We trigger the on focus event
-        self._doFocus(focused, ensure=False)
+        # We trigger the on focus event, only when the focus changed
+        if focused is not self._focused:
+            self._focused = focused
+            self._doFocus(focused, ensure=False)
         # We update the tooltip and info in the footer
-        if hasattr(focused, "_urwideInfo"):
-            self.info(self._strings.get(focused._urwideInfo) or focused._urwideInfo)
-        if hasattr(focused, "_urwideTooltip"):
-            self.tooltip(
-                self._strings.get(focused._urwideTooltip) or focused._urwideTooltip
-            )
+        info = widget_meta(focused, "info")
+        if info:
+            self.info(self._strings.get(info) or info)
+        tooltip = widget_meta(focused, "tooltip")
+        if tooltip:
+            self.tooltip(self._strings.get(tooltip) or tooltip)
         # We draw the screen
         self._updateFooter()
+        t_draw = time.perf_counter()
         self.draw()
         self.tooltip("")
         self.info("")
-        # And process keys
-        if not self.isRunning:
-            return
-        keys = self._ui.get_input()
+        return (focused, t_start, t_draw, time.perf_counter())
+
+    def processKeys(self, frame, keys):
+        """Processes the given keys, received after the given frame (see
+        'drawFrame'), and runs the timers that are due."""
+        focused, t_start, t_draw, t_input = frame
+        t_keys = time.perf_counter()
+        if self._recorder and keys:
+            self._recorder.keys(keys)
         if isinstance(focused, urwid.Edit):
             old_text = focused.get_edit_text()
         # We handle keys
@@ -1126,35 +3845,116 @@ class Console(UI):
             # NOTE: The key press might actually be send not to the focused
             # widget but to its original_widget
             if key == "window resize":
-                self._currentSize = self._ui.get_cols_rows()
-            elif self._dialog:
-                self._doKeyPress(self._dialog.view(), key)
+                self._resizeLater()
+            elif self._dialogs:
+                self._doKeyPress(self._dialogs[-1].view(), key)
             else:
                 self._doKeyPress(focused, key)
         # We check if there was a change in the edit, and we fire and event
         if isinstance(focused, urwid.Edit):
-            self._doEdit(focused, old_text, focused.get_edit_text(), ensure=False)
+            new_text = focused.get_edit_text()
+            if new_text != old_text:
+                self._doEdit(focused, old_text, new_text, ensure=False)
+        elif isinstance(focused, DocEdit):
+            deltas = focused.deltas()
+            if deltas:
+                self._doEdit(focused, deltas, ensure=False)
+        self._runTimers()
+        # We collect the frame time breakdown
+        t_end = time.perf_counter()
+        frame = (t_draw - t_start, t_input - t_draw, t_end - t_keys)
+        self.stats.sample("frame", sum(frame))
+        self.stats.sample("frame.focus", frame[0])
+        self.stats.sample("frame.draw", frame[1])
+        self.stats.sample("frame.keys", frame[2])
+        if self._recorder:
+            self._recorder.frame(frame)
+
+    def _resizeLater(self):
+        """Debounces the resizes (see 'RESIZE_DELAY'), so that a terminal
+        being resized is neither queried nor drawn at each intermediate
+        size."""
+        if self._resizeTimer:
+            self.cancel(self._resizeTimer)
+        if self.RESIZE_DELAY:
+            self._resizeTimer = self.after(self.RESIZE_DELAY, self._resize)
+        else:
+            self._resize()
+
+    def _resize(self):
+        self._resizeTimer = None
+        self._currentSize = self._ui.get_cols_rows()
+        if self._recorder:
+            self._recorder.resize(self._currentSize)
+
+    def _setInputWait(self, wait):
+        """Sets the maximum time (in seconds) the screen waits for input,
+        so that the loop wakes up for the next timer ('None' waits forever)."""
+        if wait != self._inputWait and hasattr(self._ui, "set_input_timeouts"):
+            self._inputWait = wait
+            self._ui.set_input_timeouts(max_wait=wait)
 
     def draw(self):
         """Main loop to draw the console. This takes into account the fact that
         there may be a dialog to display."""
-        if self._dialog != None:
-            o = urwid.Overlay(
-                self._dialog.view(),
-                self._frame,
-                "center",
-                self._dialog.width(),
-                "middle",
-                self._dialog.height(),
-            )
-            canvas = o.render(self._currentSize, focus=True)
+        if self._resizeTimer:
+            return
+        self._ui.draw_screen(self._currentSize, self.render(self._currentSize))
+
+    def render(self, size):
+        """Renders the console with its stack of dialogs at the given size and
+        returns the canvas. The layers below the top dialog are composed and
+        rendered as a single canvas, which is cached (see 'invalidateLayers')
+        so that the cost of a frame does not depend on the number of
+        dialogs."""
+        # We keep a reference to the last canvas, so that URWID's canvas cache
+        # (which only has weak references) can reuse it for the next frame.
+        canvas = self._render(size)
+        # The focus and key route may have been looked up after a change that
+        # is only now drawn, in which case they are looked up again.
+        if canvas is not self._canvas:
+            self._focus = self._route = None
+        self._canvas = self._canvases.put(size, canvas)
+        return canvas
+
+    def _render(self, size):
+        if not self._dialogs:
+            self._drawn = (self._frame, size)
+            return self._frame.render(size, focus=True)
+        layers = tuple(self._dialogs)
+        if not self._layers or self._layers[0] != layers:
+            widget = self._frame
+            for dialog in layers[:-1]:
+                widget = self._overlay(dialog, widget)
+            top = CanvasWidget()
+            top = self._overlay(layers[-1], top)
+            self._layers = [layers, widget, top, SizeCache(self.LAYOUT_SIZES)]
+        layers, widget, top, canvases = self._layers
+        canvas = canvases.get(size)
+        if canvas is None or not CanvasWidget.isCached(widget, size, canvas):
+            canvas = canvases.put(size, widget.render(size, focus=False))
+            self.stats.count("layers.miss")
         else:
-            canvas = self._frame.render(self._currentSize, focus=True)
-        self._ui.draw_screen(self._currentSize, canvas)
+            self.stats.count("layers.hit")
+        if top.bottom_w._canvas is not canvas:
+            top.bottom_w.setCanvas(canvas)
+        self._drawn = (top, size)
+        return top.render(size, focus=True)
+
+    def _overlay(self, dialog, widget):
+        return urwid.Overlay(
+            dialog.view(), widget, "center", dialog.width(), "middle", dialog.height()
+        )
 
     def _updateFooter(self):
         """Updates the frame footer according to info and tooltip"""
-        remove_widgets(self._footer)
+        state = (self.tooltip(), self.info(), self.footer(), self._hud)
+        # The footer is only rebuilt when it changes, as rebuilding it
+        # invalidates the whole frame. The statistics are a text of their own,
+        # updated by '_refreshHud'.
+        if state == self._footerState:
+            return
+        self._footerState = state
         footer = []
         if self.tooltip():
             footer.append(
@@ -1166,9 +3966,12 @@ class Console(UI):
             footer.append(
                 self._styleWidget(urwid.Text(self.footer()), {"style": "footer"})
             )
+        if self._hud:
+            if self._hudWidget is None:
+                self._hudWidget = self._styleWidget(self._hudText, {"style": "hud"})
+            footer.append(self._hudWidget)
+        replace_contents(self._footer, footer)
         if footer:
-            for _ in footer:
-                add_widget(self._footer, _)
             self._footer.set_focus(0)
 
     def parseUI(self, text):
@@ -1185,6 +3988,996 @@ class Console(UI):
         self.footer(data)
 
 
+# ------------------------------------------------------------------------------
+#
+# SESSION RECORDING
+#
+# ------------------------------------------------------------------------------
+
+
+class Recorder:
+    """Records a console session to a file, as JSON lines (gzipped when the
+    path ends with '.gz'). Each line is a list starting with the event type
+    and the time (in seconds) since the start of the session:
+
+    - `["s", t, cols, rows]` when the session starts,
+    - `["k", t, keys]` for each batch of keys returned by the screen,
+    - `["r", t, cols, rows]` when the terminal is resized,
+    - `["f", t, focus, draw, keys]` for the time spent in each phase of a
+      frame (see 'Console.loop').
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._file = None
+        self._start = None
+
+    def _write(self, *event):
+        line = json.dumps([event[0], round(time.time() - self._start, 4)] + list(event[1:]))
+        self._file.write(line + "\n")
+
+    def start(self, size):
+        import gzip
+
+        opener = gzip.open if self.path.endswith(".gz") else open
+        self._file = opener(self.path, "wt")
+        self._start = time.time()
+        self._write("s", *size)
+
+    def keys(self, keys):
+        self._write("k", keys)
+
+    def resize(self, size):
+        self._write("r", *size)
+
+    def frame(self, times):
+        self._write("f", *(round(_, 6) for _ in times))
+
+    def close(self):
+        if self._file:
+            self._file.close()
+            self._file = None
+
+
+class ReplayScreen:
+    """A screen that feeds the keys and resizes of a recorded session to a
+    console (see 'Replayer'). When 'speed' is given, keys are delivered at
+    the recorded pace divided by 'speed', otherwise as fast as possible."""
+
+    def __init__(self, events, console, speed=None):
+        self._events = collections.deque(events)
+        self._console = console
+        self._speed = speed
+        self._size = (80, 24)
+        self._sizes = collections.deque()
+        self._start = time.time()
+        while self._events and self._events[0][0] != "k":
+            event = self._events.popleft()
+            if event[0] == "s":
+                self._size = tuple(event[2:4])
+
+    def get_cols_rows(self):
+        if self._sizes:
+            self._size = self._sizes.popleft()
+        return self._size
+
+    def get_input(self):
+        if not self._events:
+            self._console.end()
+            return []
+        event = self._events.popleft()
+        if self._speed:
+            wait = self._start + event[1] / self._speed - time.time()
+            if wait > 0:
+                time.sleep(wait)
+        # The resizes that follow the keys are the ones they triggered
+        while self._events and self._events[0][0] != "k":
+            _ = self._events.popleft()
+            if _[0] == "r":
+                self._sizes.append(tuple(_[2:4]))
+        return [tuple(_) if isinstance(_, list) else _ for _ in event[2]]
+
+    def draw_screen(self, size, canvas):
+        pass
+
+    def register_palette(self, palette):
+        pass
+
+    def clear(self):
+        pass
+
+
+class Replayer:
+    """Replays a session recorded with 'Console.record' against a console
+    built with the same UI, and reports the distribution of frame times.
+
+    >   console = urwide.Console().create(STYLE, UI, Handler())
+    >   report = urwide.Replayer("session.jsonl.gz").run(console)
+    >   print(report["frame"]["p99"])
+    """
+
+    def __init__(self, path):
+        import gzip
+
+        opener = gzip.open if path.endswith(".gz") else open
+        with opener(path, "rt") as f:
+            self.events = [json.loads(_) for _ in f if _.strip()]
+
+    def recorded(self):
+        """Returns the distribution of the frame times as recorded."""
+        stats = Stats()
+        for event in self.events:
+            if event[0] == "f":
+                stats.sample("frame", sum(event[2:]))
+        return stats.distribution("frame")
+
+    def run(self, console, speed=None):
+        """Replays the session on the given console, at the recorded pace
+        divided by 'speed' or as fast as possible when 'speed' is 'None'.
+        Returns a dict with the distributions of the frame times of the
+        replay ('frame', 'frame.focus', 'frame.draw', 'frame.keys')."""
+        console.stats.reset()
+        screen, delay = console._ui, console.RESIZE_DELAY
+        console._ui = ReplayScreen(self.events, console, speed)
+        # The recorded resizes are the ones that were applied, once debounced
+        console.RESIZE_DELAY = 0
+        try:
+            console.run()
+        finally:
+            console._ui = screen
+            console.RESIZE_DELAY = delay
+        names = ("frame", "frame.focus", "frame.draw", "frame.keys")
+        return dict((_, console.stats.distribution(_)) for _ in names)
+
+
+# ------------------------------------------------------------------------------
+#
+# DAMAGE TRACKING
+#
+# ------------------------------------------------------------------------------
+
+
+def row_cells(row):
+    """Returns the given canvas row (as given by 'canvas.content()') as a
+    list of '(attr, character)' cells, where the second cell of a wide
+    character is empty."""
+    res = []
+    for attr, cs, text in row:
+        text = text.decode(ENCODING, "replace")
+        if text.isascii():
+            res.extend((attr, _) for _ in text)
+        else:
+            for _ in text:
+                res.append((attr, _))
+                if urwid.str_util.get_width(ord(_)) == 2:
+                    res.append((attr, ""))
+    return res
+
+
+def row_damage(previous, cells):
+    """Returns the '(start, end)' span of the given cells that differs from
+    the 'previous' cells of the same row (all the cells when there are no
+    previous cells), or 'None' when they are the same. Wide characters are
+    never split."""
+    start, end = 0, len(cells)
+    if previous is not None and len(previous) == len(cells):
+        while start < end and cells[start] == previous[start]:
+            start += 1
+        while end > start and cells[end - 1] == previous[end - 1]:
+            end -= 1
+        if start == end:
+            return None
+        if start and cells[start][1] == "":
+            start -= 1
+        if end < len(cells) and cells[end][1] == "":
+            end += 1
+    return (start, end) if start < end else None
+
+
+class Damage:
+    """Keeps track of the cells displayed on a terminal, and returns the
+    escape sequences that update the terminal to a new canvas, where only
+    the damaged span of each changed row is written. The attributes are
+    given as escape sequences by 'escape' (a callable), which are only
+    written when the attribute changes, and the cursor is only moved when
+    it is not already at the right place.
+
+    Runs of blanks are erased rather than written when 'erasable' (a
+    callable) tells that erasing gives the same result for their attribute
+    (that is, the terminal erases with the background color, and the
+    attribute is neither underlined nor in standout)."""
+
+    UNSET = object()
+
+    def __init__(self, escape, erasable=None):
+        self.escape = escape
+        self.erasable = erasable
+        self.rows = []
+
+    def clear(self):
+        self.rows = []
+
+    def move(self, cursor, x, y):
+        if cursor == (x, y):
+            return ""
+        elif x == 0 and cursor[1] >= 0 and cursor[1] == y - 1:
+            return "\r\n"
+        elif cursor[1] == y and cursor[0] < x:
+            return "\x1b[%dC" % (x - cursor[0])
+        else:
+            return "\x1b[%d;%dH" % (y + 1, x + 1)
+
+    def update(self, canvas):
+        """Returns the escape sequences that update the terminal from the last
+        canvas to the given one."""
+        res = []
+        rows = self.rows
+        cursor = (-1, -1)
+        attr = self.UNSET
+        escape = self.escape
+        erasable = self.erasable
+        for y, row in enumerate(canvas.content()):
+            if y < len(rows) and rows[y][0] == row:
+                continue
+            cells = row_cells(row)
+            span = row_damage(rows[y][1] if y < len(rows) else None, cells)
+            if y < len(rows):
+                rows[y] = (row, cells)
+            else:
+                rows.append((row, cells))
+            if span is None:
+                continue
+            start, end = span
+            res.append(self.move(cursor, start, y))
+            x = start
+            while x < end:
+                a, char = cells[x]
+                if a != attr:
+                    res.append(escape(a))
+                    attr = a
+                if char == " " and erasable and erasable(a):
+                    blank = x
+                    while blank < end and cells[blank] == (a, " "):
+                        blank += 1
+                    if blank == len(cells) and blank - x > 3:
+                        res.append("\x1b[K")
+                        break
+                    elif blank - x > 8:
+                        res.append("\x1b[%dX\x1b[%dC" % (blank - x, blank - x))
+                        x = blank
+                        continue
+                res.append(char)
+                x += 1
+            # Autowrap is off, so the cursor stays on the last column
+            cursor = (min(x, len(cells) - 1), y)
+        del rows[canvas.rows() :]
+        return "".join(res)
+
+
+class DamageScreen(urwid.raw_display.Screen):
+    """A terminal screen for low-bandwidth links (such as SSH over a slow
+    network), that can be given to 'Console.main'. Only the damaged cells
+    are written (see 'Damage'), each frame is written with a single system
+    call and wrapped in DEC synchronized output (mode 2026) when the
+    terminal supports it, or when 'sync' is true. The number of bytes
+    written per frame is sampled as 'screen.bytes' in the 'stats'."""
+
+    SYNC_START = "\x1b[?2026h"
+    SYNC_END = "\x1b[?2026l"
+
+    def __init__(self, sync=None, *args, **kwargs):
+        urwid.raw_display.Screen.__init__(self, *args, **kwargs)
+        self.sync = sync
+        self.stats = Stats()
+        self._damage = Damage(self._attr_to_escape, self.isErasable)
+
+    def clear(self):
+        urwid.raw_display.Screen.clear(self)
+        self._damage.clear()
+
+    def isErasable(self, attr):
+        if not self.back_color_erase:
+            return False
+        spec = self._pal_attrspec.get(attr, attr)
+        return not (getattr(spec, "standout", False) or getattr(spec, "underline", False))
+
+    def isSynchronized(self):
+        if self.sync is not None:
+            return self.sync
+        modes = getattr(self, "modes", None)
+        return bool(modes and modes.synchronized_output)
+
+    def draw_screen(self, size, canvas):
+        if not self._started:
+            raise UIRuntimeError("The screen is not started")
+        if self._resized:
+            return
+        # The screen buffer is reset on resize and clear
+        if not self.screen_buf:
+            self._damage.clear()
+        output = ["\x1b[?25l\x1b[?7l", self._damage.update(canvas), "\x1b[?7h"]
+        if canvas.cursor is not None:
+            x, y = canvas.cursor
+            output.append("\x1b[%d;%dH\x1b[?25h" % (y + 1, x + 1))
+        if self.isSynchronized():
+            output = [self.SYNC_START] + output + [self.SYNC_END]
+        data = "".join(output).encode(ENCODING)
+        self.flush()
+        fd = self._term_output_file.fileno()
+        written = 0
+        while written < len(data):
+            written += os.write(fd, data[written:])
+        self.stats.sample("screen.bytes", len(data))
+        self.screen_buf = self._damage.rows
+        self._screen_buf_canvas = canvas
+
+
+# ------------------------------------------------------------------------------
+#
+# WEB BACKEND
+#
+# ------------------------------------------------------------------------------
+
+WEB_PAGE = """\
+<!DOCTYPE html>
+<html><head><meta charset="utf-8"><title>URWIDE</title>
+<style>body{margin:0;background:#000}.urwide{margin:0;font-size:14px}</style>
+<style id="palette"></style></head>
+<body><pre class="urwide" id="screen"></pre><script>
+var rows = [], screen = document.getElementById("screen");
+var ws = new WebSocket("ws://" + location.host + "/ws");
+var KEYS = {Enter:"enter", Backspace:"backspace", Delete:"delete", Escape:"esc",
+  Tab:"tab", ArrowUp:"up", ArrowDown:"down", ArrowLeft:"left",
+  ArrowRight:"right", Home:"home", End:"end", PageUp:"page up",
+  PageDown:"page down", Insert:"insert"};
+function esc(t) {return t.replace(/&/g, "&amp;").replace(/</g, "&lt;")}
+function draw(r) {
+  var h = "", cls = null, text = "";
+  rows[r].forEach(function (c) {
+    if (c[0] != cls) {
+      if (cls !== null) {h += '<span class="' + cls + '">' + esc(text) + "</span>"}
+      cls = c[0]; text = "";
+    }
+    text += c[1];
+  });
+  if (cls !== null) {h += '<span class="' + cls + '">' + esc(text) + "</span>"}
+  screen.children[r].innerHTML = h;
+}
+function resize() {
+  var w = screen.getBoundingClientRect().width || 800;
+  ws.send(JSON.stringify({t: "resize",
+    cols: Math.floor(window.innerWidth / (w / Math.max(1, (rows[0] || []).length || 80))),
+    rows: Math.floor(window.innerHeight / 17)}));
+}
+ws.onopen = resize;
+window.onresize = resize;
+ws.onmessage = function (event) {
+  var m = JSON.parse(event.data);
+  if (m.t == "style") {document.getElementById("palette").textContent = m.css}
+  if (m.t == "clear") {rows = []; screen.innerHTML = ""}
+  if (m.t != "frame") {return}
+  m.rows.forEach(function (u) {
+    var r = u[0], col = u[1], cells = [];
+    while (rows.length <= r) {rows.push([]); screen.appendChild(document.createElement("div"))}
+    u[2].forEach(function (run) {
+      var cs = typeof run[1] == "string" ? Array.from(run[1]) : run[1];
+      cs.forEach(function (c) {cells.push([run[0], c])});
+    });
+    rows[r].splice.apply(rows[r], [col, cells.length].concat(cells));
+    draw(r);
+  });
+};
+document.onkeydown = function (e) {
+  var k = KEYS[e.key] || (e.key.length == 1 ? e.key : null);
+  if (!k) {return}
+  if (e.ctrlKey) {k = "ctrl " + k.toLowerCase()}
+  else if (e.altKey) {k = "meta " + k}
+  else if (e.shiftKey && k.length > 1) {k = "shift " + k}
+  ws.send(JSON.stringify({t: "keys", keys: [k]}));
+  e.preventDefault();
+};
+</script></body></html>
+"""
+
+
+class WebClient:
+    """A client that applies the messages sent by a 'WebScreen' to its own
+    copy of the screen, like the browser page does. It is used by the
+    'LoopbackTransport' to test web UIs without a network."""
+
+    def __init__(self):
+        self.rows = []
+        self.css = None
+
+    def apply(self, message):
+        message = json.loads(message) if type(message) in (str,) else message
+        if message["t"] == "style":
+            self.css = message["css"]
+        elif message["t"] == "clear":
+            self.rows = []
+        elif message["t"] == "frame":
+            for row, col, runs in message["rows"]:
+                while len(self.rows) <= row:
+                    self.rows.append([])
+                cells = [(run[0], _) for run in runs for _ in run[1]]
+                self.rows[row][col : col + len(cells)] = cells
+
+    def text(self):
+        """Returns the text displayed by the client."""
+        return "\n".join("".join(_[1] for _ in row) for row in self.rows)
+
+
+class LoopbackTransport:
+    """An in-process transport for a 'WebScreen', where the messages sent
+    by the screen are applied to a 'WebClient' and the keys are given with
+    'press'."""
+
+    def __init__(self, cols=80, rows=24):
+        self.client = WebClient()
+        self.sent = []
+        self._incoming = collections.deque(
+            [json.dumps({"t": "resize", "cols": cols, "rows": rows})]
+        )
+
+    def start(self):
+        pass
+
+    def stop(self):
+        pass
+
+    def press(self, *keys):
+        """Sends the given keys to the screen, as the browser would."""
+        self._incoming.append(json.dumps({"t": "keys", "keys": list(keys)}))
+
+    def resize(self, cols, rows):
+        self._incoming.append(json.dumps({"t": "resize", "cols": cols, "rows": rows}))
+
+    def send(self, message):
+        self.sent.append(message)
+        self.client.apply(message)
+
+    def receive(self, timeout=None):
+        res = list(self._incoming)
+        self._incoming.clear()
+        return res
+
+
+class WebSocketTransport:
+    """Serves the 'WEB_PAGE' and a websocket (at '/ws') over HTTP on the
+    given local address, using only the standard library. Messages are
+    broadcast to all the connected pages.
+
+    The websocket is only accepted from the page it serves: its 'Origin'
+    must be the host it was requested from, which must be the address of
+    the transport, so that other web pages (even through DNS rebinding)
+    cannot read the screen or send keys."""
+
+    GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+    LOCAL = ("127.0.0.1", "localhost", "::1")
+
+    def __init__(self, host="127.0.0.1", port=8000):
+        self.address = (host, port)
+        self._server = None
+        self._clients = []
+        self._messages = queue.Queue()
+        self._lock = threading.Lock()
+        self._last = {}
+
+    def start(self):
+        import http.server
+
+        transport = self
+
+        class RequestHandler(http.server.BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                if self.path == "/ws":
+                    transport._accept(self)
+                else:
+                    page = WEB_PAGE.encode("utf8")
+                    self.send_response(200)
+                    self.send_header("Content-Type", "text/html; charset=utf-8")
+                    self.send_header("Content-Length", str(len(page)))
+                    self.end_headers()
+                    self.wfile.write(page)
+
+            def log_message(self, *args):
+                pass
+
+        self._server = http.server.ThreadingHTTPServer(self.address, RequestHandler)
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+
+    def stop(self):
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def isAllowed(self, request):
+        """Tells if the given HTTP request comes from a page served by this
+        transport (see the class documentation)."""
+        import urllib.parse
+
+        host = request.headers.get("Host", "")
+        origin = request.headers.get("Origin", "")
+        if not host or origin.split("://", 1)[-1] != host:
+            return False
+        name, port = self.address
+        try:
+            url = urllib.parse.urlsplit("//" + host)
+            if (url.port or 80) != port:
+                return False
+        except ValueError:
+            return False
+        if name in self.LOCAL:
+            return url.hostname in self.LOCAL
+        return name in ("", "0.0.0.0", "::") or url.hostname == name
+
+    def _accept(self, request):
+        """Upgrades the given HTTP request to a websocket and reads its
+        messages until it is closed."""
+        if not self.isAllowed(request):
+            request.send_error(403)
+            return
+        key = request.headers.get("Sec-WebSocket-Key", "") + self.GUID
+        accept = base64.b64encode(hashlib.sha1(key.encode("ascii")).digest())
+        request.send_response(101, "Switching Protocols")
+        request.send_header("Upgrade", "websocket")
+        request.send_header("Connection", "Upgrade")
+        request.send_header("Sec-WebSocket-Accept", accept.decode("ascii"))
+        request.end_headers()
+        request.wfile.flush()
+        stream = request.connection
+        with self._lock:
+            self._clients.append(stream)
+            # New pages get the last style and a full frame
+            for message in self._last.values():
+                self._write(stream, message)
+        self._messages.put(json.dumps({"t": "connect"}))
+        # The fragments of the text message being received
+        fragments = None
+        try:
+            while True:
+                final, opcode, payload = self._read(request.rfile)
+                if opcode == 8 or opcode is None:
+                    break
+                elif opcode == 9:
+                    with self._lock:
+                        self._write(stream, payload, 10)
+                    continue
+                elif opcode == 10:
+                    continue
+                elif opcode == 1 and fragments is None:
+                    fragments = [payload]
+                elif opcode == 0 and fragments is not None:
+                    fragments.append(payload)
+                else:
+                    # Binary messages are not supported (nor are stray
+                    # continuations)
+                    with self._lock:
+                        self._write(stream, struct.pack("!H", 1003), 8)
+                    break
+                if final:
+                    self._messages.put(b"".join(fragments).decode("utf8"))
+                    fragments = None
+        finally:
+            with self._lock:
+                self._clients.remove(stream)
+            request.close_connection = True
+
+    def _read(self, stream):
+        """Reads a (masked) frame from the client, returning whether it is
+        the final fragment of its message, its opcode and its payload."""
+        head = stream.read(2)
+        if len(head) < 2:
+            return True, None, None
+        opcode, length = head[0] & 0x0F, head[1] & 0x7F
+        if length == 126:
+            length = struct.unpack("!H", stream.read(2))[0]
+        elif length == 127:
+            length = struct.unpack("!Q", stream.read(8))[0]
+        mask = stream.read(4) if head[1] & 0x80 else b"\0\0\0\0"
+        payload = bytearray(stream.read(length))
+        for i in range(len(payload)):
+            payload[i] ^= mask[i % 4]
+        return bool(head[0] & 0x80), opcode, bytes(payload)
+
+    def _write(self, stream, payload, opcode=1):
+        payload = payload.encode("utf8") if type(payload) in (str,) else payload
+        length = len(payload)
+        if length < 126:
+            head = struct.pack("!BB", 0x80 | opcode, length)
+        elif length < 65536:
+            head = struct.pack("!BBH", 0x80 | opcode, 126, length)
+        else:
+            head = struct.pack("!BBQ", 0x80 | opcode, 127, length)
+        try:
+            stream.sendall(head + payload)
+        except OSError:
+            pass
+
+    def send(self, message):
+        with self._lock:
+            kind = json.loads(message)["t"]
+            if kind != "frame":
+                self._last[kind] = message
+            for stream in self._clients:
+                self._write(stream, message)
+
+    def receive(self, timeout=None):
+        """Returns the messages received from the pages, waiting at most
+        'timeout' seconds ('None' waits until there is one)."""
+        try:
+            res = [self._messages.get(timeout=timeout)]
+        except queue.Empty:
+            return []
+        while not self._messages.empty():
+            res.append(self._messages.get_nowait())
+        return res
+
+
+class WebScreen:
+    """A display that can be given to 'Console.main' in place of the
+    terminal, which shows the console in browser pages through a transport
+    (a 'WebSocketTransport' by default, or a 'LoopbackTransport' for tests).
+
+    Only the cells that changed since the previous frame are sent, as runs
+    of cells with the same attribute, so the size of a frame on the wire
+    depends on what changed and not on the size of the screen. The number
+    of bytes sent per frame is sampled as 'screen.bytes' in the 'stats'."""
+
+    def __init__(self, transport=None, cols=80, rows=24):
+        self.transport = transport or WebSocketTransport()
+        self.stats = Stats()
+        self._size = (cols, rows)
+        self._rows = []
+        self._maxWait = None
+        self._html = HTMLSnapshot([])
+
+    def run_wrapper(self, function):
+        self.transport.start()
+        try:
+            return function()
+        finally:
+            self.transport.stop()
+
+    def clear(self):
+        self._rows = []
+        self.transport.send(json.dumps({"t": "clear"}))
+
+    def register_palette(self, palette):
+        self._html = HTMLSnapshot(palette)
+        css = self._html.css()
+        self.transport.send(json.dumps({"t": "style", "css": css}))
+
+    def set_input_timeouts(self, max_wait=None, **kwargs):
+        self._maxWait = max_wait
+
+    def get_cols_rows(self):
+        return self._size
+
+    def get_input(self):
+        keys = []
+        for message in self.transport.receive(self._maxWait):
+            message = json.loads(message)
+            if message["t"] == "keys":
+                keys.extend(message["keys"])
+            elif message["t"] == "resize":
+                size = (max(1, message["cols"]), max(1, message["rows"]))
+                if size != self._size:
+                    self._size = size
+                    self.clear()
+                keys.append("window resize")
+            elif message["t"] == "connect":
+                # A new page gets the whole screen
+                self._rows = []
+                keys.append("window resize")
+        return keys
+
+    def cells(self, row):
+        """Returns the given canvas row as a list of '(class, character)'
+        cells (see 'row_cells')."""
+        className = self._html.className
+        return [(className(attr), char) for attr, char in row_cells(row)]
+
+    def runs(self, cells):
+        """Returns the given cells as '[class, text]' runs, where the text
+        is a list of cells when there are wide characters."""
+        res = []
+        for name, char in cells:
+            if res and res[-1][0] == name:
+                res[-1][1].append(char)
+            else:
+                res.append([name, [char]])
+        for run in res:
+            if "" not in run[1]:
+                run[1] = "".join(run[1])
+        return res
+
+    def diff(self, canvas):
+        """Returns the list of '[row, col, runs]' updates between the last
+        frame and the given canvas, and makes the canvas the last frame."""
+        updates = []
+        rows = self._rows
+        for i, row in enumerate(canvas.content()):
+            if i < len(rows) and rows[i][0] == row:
+                continue
+            cells = self.cells(row)
+            span = row_damage(rows[i][1] if i < len(rows) else None, cells)
+            if span:
+                updates.append([i, span[0], self.runs(cells[span[0] : span[1]])])
+            if i < len(rows):
+                rows[i] = (row, cells)
+            else:
+                rows.append((row, cells))
+        return updates
+
+    def draw_screen(self, size, canvas):
+        updates = self.diff(canvas)
+        if updates:
+            message = json.dumps({"t": "frame", "rows": updates}, ensure_ascii=False)
+            self.transport.send(message)
+            self.stats.sample("screen.bytes", len(message.encode("utf8")))
+
+
+# ------------------------------------------------------------------------------
+#
+# MULTI-SESSION SERVER
+#
+# ------------------------------------------------------------------------------
+
+
+class StreamScreen:
+    """A display that writes ANSI escape sequences to a 'write' callable
+    (such as the 'write' of an asyncio stream), and that gets its input
+    from the bytes given to 'feed'. It is used by a 'Session' to display a
+    console on a remote terminal (a socket or a PTY).
+
+    The size is read from the 'fd' when it is a terminal, which is polled
+    for resizes (see 'SIZE_POLL'), and is 'size' otherwise (raw sockets do
+    not tell the size of the terminal). Like the 'DamageScreen', only the
+    damaged cells are written, and frames are wrapped in synchronized
+    output unless 'sync' is false (terminals that do not support it ignore
+    it)."""
+
+    START = "\x1b[?1049h\x1b[?25l\x1b[?7l\x1b[2J"
+    STOP = "\x1b[0m\x1b[?7h\x1b[?25h\x1b[?1049l"
+    # How often (in seconds) the size of a terminal 'fd' is polled
+    SIZE_POLL = 0.25
+
+    def __init__(self, write, size=None, fd=None, sync=True):
+        self.write = write
+        self.sync = sync
+        self.stats = Stats()
+        self._size = tuple(size or (80, 24))
+        self._fd = fd
+        self._polled = None
+        self._codes = []
+        self.register_palette([])
+
+    def start(self):
+        self._damage.clear()
+        self.write(self.START.encode(ENCODING))
+
+    def stop(self):
+        self.write(self.STOP.encode(ENCODING))
+
+    def clear(self):
+        self._damage.clear()
+
+    def register_palette(self, palette):
+        self._ansi = ANSISnapshot(palette)
+        self._damage = Damage(self._ansi.attr, self.isErasable)
+
+    def isErasable(self, attr):
+        return self._ansi.palette.get(attr, ("", "", ""))[2] not in (
+            "standout",
+            "underline",
+        )
+
+    def _terminalSize(self):
+        """Returns the size of the terminal when it is known and differs
+        from the current size, 'None' otherwise."""
+        if self._fd is None:
+            return None
+        try:
+            size = tuple(os.get_terminal_size(self._fd))
+        except OSError:
+            return None
+        # A new PTY has no size yet
+        return size if all(size) and size != self._size else None
+
+    def get_cols_rows(self):
+        size = self._terminalSize()
+        if size:
+            self._size = size
+            self._damage.clear()
+        return self._size
+
+    def feed(self, data):
+        """Adds the given bytes to the input of the screen."""
+        self._codes.extend(data)
+
+    def get_input(self):
+        keys = []
+        if self._codes:
+            keys, self._codes = urwid.escape.process_keyqueue(self._codes, False)
+            keys = [_ for _ in keys if type(_) in (str,)]
+        # A terminal does not send its resizes as input, so we poll them
+        size = self._terminalSize()
+        if size and size != self._polled:
+            self._polled = size
+            keys.append("window resize")
+        return keys
+
+    def draw_screen(self, size, canvas):
+        """Writes the cells of the canvas that changed since the last frame,
+        in a single write."""
+        res = ["\x1b[?25l", self._damage.update(canvas)]
+        if canvas.cursor is not None:
+            x, y = canvas.cursor
+            res.append("\x1b[%d;%dH\x1b[?25h" % (y + 1, x + 1))
+        if self.sync:
+            res = [DamageScreen.SYNC_START] + res + [DamageScreen.SYNC_END]
+        data = "".join(res).encode(ENCODING)
+        self.write(data)
+        self.stats.sample("screen.bytes", len(data))
+
+
+class Session:
+    """Runs a console on a remote terminal, reading its input from an
+    asyncio 'reader' and writing its output to an asyncio 'writer'.
+
+    Sessions are run by a 'Server', as tasks of the same event loop: each
+    one has its own console (and so its own handlers and state), and only
+    waits for its own terminal, so that a slow terminal does not stall the
+    other sessions. The CPU time spent by the console is accumulated in
+    'cpu' (in seconds), and sampled as 'session.cpu' in its stats."""
+
+    def __init__(self, console, reader, writer, size=None, fd=None):
+        self.console = console
+        self.reader = reader
+        self.writer = writer
+        self.screen = StreamScreen(writer.write, size, fd)
+        self.screen.stats = console.stats
+        self.cpu = 0.0
+        self.frames = 0
+        self.started = time.time()
+        self.error = None
+
+    @property
+    def peer(self):
+        return self.writer.get_extra_info("peername")
+
+    async def run(self):
+        """Runs the console until it ends or the terminal is closed."""
+        console = self.console
+        screen = self.screen
+        console._ui = screen
+        if console._palette:
+            screen.register_palette(console._palette)
+        screen.start()
+        console.isRunning = True
+        console._currentSize = screen.get_cols_rows()
+        try:
+            while console.isRunning:
+                t = time.process_time()
+                frame = console.drawFrame()
+                wait = console._timerWait()
+                if screen._fd is not None:
+                    poll = screen.SIZE_POLL
+                    wait = poll if wait is None else min(wait, poll)
+                self.frames += 1
+                self._account(t)
+                await self.writer.drain()
+                if not console.isRunning:
+                    break
+                try:
+                    data = await asyncio.wait_for(self.reader.read(4096), wait)
+                except asyncio.TimeoutError:
+                    data = None
+                else:
+                    if not data:
+                        break
+                t = time.process_time()
+                screen.feed(data or b"")
+                console.processKeys(frame, screen.get_input())
+                self._account(t)
+        except (Exception, SystemExit) as e:
+            # An error in a handler only ends its own session
+            self.error = e
+            console.isRunning = False
+        finally:
+            try:
+                screen.stop()
+                await self.writer.drain()
+                self.writer.close()
+            except (OSError, RuntimeError):
+                pass
+
+    def _account(self, started):
+        cpu = time.process_time() - started
+        self.cpu += cpu
+        self.console.stats.sample("session.cpu", cpu)
+
+    def memory(self):
+        """Returns an estimate of the memory (in bytes) used by the widgets
+        of the session's console and dialogs (see 'UI.memoryReport')."""
+        return self.console.memoryReport()["bytes"]
+
+    def report(self):
+        """Returns the accounting of the session, as a dict."""
+        return {
+            "peer": self.peer,
+            "uptime": time.time() - self.started,
+            "cpu": self.cpu,
+            "memory": self.memory(),
+            "frames": self.frames,
+        }
+
+
+class Server:
+    """Serves consoles to many terminals from a single process, where
+    'factory' is a callable that returns a new console for each session
+    (usually by calling 'create' with the same style and UI).
+
+    The parsed styles and UI attributes are cached by the 'UI' class, so
+    the templates are only parsed once per process and shared by all the
+    sessions. Consoles can be served over TCP with 'serve' (the client
+    terminal should be in raw mode, for instance 'stty raw -echo; nc HOST
+    PORT'), or on a PTY with 'attach'."""
+
+    def __init__(self, factory):
+        self.factory = factory
+        self.sessions = set()
+
+    async def open(self, reader, writer, size=None, fd=None):
+        """Runs a new session on the given streams, until it ends."""
+        session = Session(self.factory(), reader, writer, size, fd)
+        self.sessions.add(session)
+        try:
+            await session.run()
+        finally:
+            self.sessions.discard(session)
+        return session
+
+    async def serve(self, host="127.0.0.1", port=2323, size=(80, 24)):
+        """Serves a session to each TCP connection on the given address."""
+        server = await asyncio.start_server(
+            lambda reader, writer: self.open(reader, writer, size), host, port
+        )
+        async with server:
+            await server.serve_forever()
+
+    async def attach(self, fd):
+        """Runs a session on the terminal with the given file descriptor
+        (such as the slave side of a PTY), which is put in raw mode."""
+        import tty
+
+        tty.setraw(fd)
+        loop = asyncio.get_running_loop()
+        reader = asyncio.StreamReader()
+        await loop.connect_read_pipe(
+            lambda: asyncio.StreamReaderProtocol(reader),
+            os.fdopen(fd, "rb", 0, closefd=False),
+        )
+        transport, protocol = await loop.connect_write_pipe(
+            asyncio.streams.FlowControlMixin, os.fdopen(fd, "wb", 0, closefd=False)
+        )
+        writer = asyncio.StreamWriter(transport, protocol, reader, loop)
+        return await self.open(reader, writer, fd=fd)
+
+    def run(self, host="127.0.0.1", port=2323, size=(80, 24)):
+        """Serves the consoles over TCP until interrupted."""
+        asyncio.run(self.serve(host, port, size))
+
+    def report(self):
+        """Returns the accounting of each session (see 'Session.report')."""
+        return [_.report() for _ in self.sessions]
+
+
 # ------------------------------------------------------------------------------
 #
 # DIALOG CLASSES
@@ -1207,6 +5000,9 @@ class Dialog(UI):
 	dialog.shadow : DB, BL, SO
 	dialog.border : Lg, DB, SO
 	"""
+    # Dialogs are measured and shown whole, and their state is saved right
+    # after they are made (see 'reset'), so nothing is deferred
+    DEFER_AFTER = None
 
     def __init__(
         self,
@@ -1224,7 +5020,7 @@ class Dialog(UI):
         be automatically computed from the given 'ui'."""
         UI.__init__(self)
         self._width = width
-        self._height = ui.count("\n") + 1 if height == -1 else height
+        self._height = height
         self._style = style
         self._view = None
         self._headertext = header
@@ -1232,6 +5028,8 @@ class Dialog(UI):
         self._startCallback = idem
         self._endCallback = idem
         self._palette = None
+        self._initial = []
+        self._pool = None
         self.make(ui, palette)
 
     # TODO: Shouldn't these be properties
@@ -1269,18 +5067,30 @@ class Dialog(UI):
             content.append(urwid.Text(""))
             content.append(urwid.Divider("_"))
         content.extend(self.parseUI(uitext))
+        self._initial = self._saveState(content)
+        # Shadow
+        shadow = self.hasStyle(self._style + ".shadow", "dialog.shadow", "shadow")
+        border = self.hasStyle(self._style + ".border", "dialog.border", "border")
+        if self._height == -1:
+            # The height is measured from the content, which is displayed
+            # within a 1-cell padding and the 2-cell shadow.
+            width = self._width - 2 - (2 if shadow else 0)
+            self._height = sum(METRICS.rows(_, width) for _ in content)
+            self._height += 1 if shadow else 0
+        self._listbox = urwid.ListBox(content)
         w = style(
-            urwid.ListBox(content),
+            self._listbox,
             {"style": (self._style + ".content", "dialog.content", self._style)},
         )
         # We wrap the dialog into a box
         w = urwid.Padding(w, ("fixed left", 1), ("fixed right", 1))
         # w = urwid.Filler(w,  ('fixed top', 1),  ('fixed bottom',1))
         w = style(w, {"style": (self._style + ".body", "dialog.body", self._style)})
+        # The dialog style is merged in the body wrapper, which makes the
+        # content wrapper redundant when they use the same style.
         w = style(w, {"style": (self._style, "dialog")})
-        # Shadow
-        shadow = self.hasStyle(self._style + ".shadow", "dialog.shadow", "shadow")
-        border = self.hasStyle(self._style + ".border", "dialog.border", "border")
+        if type(w) in ATTRIBUTE_WRAPPERS:
+            w = fold_attributes(w)
         if shadow:
             if border:
                 border = (border, "  ")
@@ -1299,7 +5109,86 @@ class Dialog(UI):
             w = urwid.Frame(w, footer=urwid.AttrWrap(urwid.Text(border), shadow))
         self._view = w
         self._startCallback(self)
-        w._urwideOnKey = self.doKeyPress
+        set_widget_meta(w, "onKey", self.doKeyPress)
+
+    def _saveState(self, content):
+        """Returns the list of '(widget, state, text, handlers)' for all the
+        widgets of the given content, so that the dialog can be 'reset'. The
+        'text' is the '(text, attributes)' of a text, or the label of a
+        button or check box."""
+        res = []
+        stack = list(content)
+        while stack:
+            widget = stack.pop()
+            state = text = None
+            if isinstance(widget, urwid.Edit):
+                state = widget.get_edit_text()
+            elif isinstance(widget, DocEdit):
+                state = widget.get_text()
+            elif isinstance(widget, urwid.CheckBox):
+                state = widget.get_state()
+                text = widget.get_label()
+            elif isinstance(widget, urwid.Button):
+                text = widget.get_label()
+            elif isinstance(widget, urwid.Text):
+                text = widget.get_text()
+            handlers = dict(
+                (_, widget_meta(widget, _))
+                for _ in WidgetMeta.HANDLERS
+                if widget_meta(widget, _)
+            )
+            if state is not None or text is not None or handlers:
+                res.append((widget, state, text, handlers))
+            elif widget_meta(widget, "id"):
+                res.append((widget, state, text, handlers))
+            stack.extend(widget_children(widget))
+        return res
+
+    def reset(self, texts=None, data=None):
+        """Restores the dialog as it was right after being made: edits,
+        check boxes and radio buttons get their initial state back, the
+        handlers set with 'onPress' and the like are replaced by the ones from
+        the UI description, texts and labels get their initial text back, and
+        the first widget gets the focus. The given 'texts' map widget ids to
+        their new text (or label) and 'data' replaces the content of
+        'ui.data'."""
+        for widget, state, text, handlers in self._initial:
+            if isinstance(widget, urwid.Edit):
+                widget.set_edit_text(state)
+            elif isinstance(widget, DocEdit):
+                widget.set_text(state)
+            elif isinstance(widget, urwid.RadioButton):
+                if state:
+                    widget.set_state(True, do_callback=False)
+            elif isinstance(widget, urwid.CheckBox):
+                widget.set_state(state, do_callback=False)
+            # Texts are only set again when they changed, as it invalidates
+            # their layout
+            if isinstance(widget, (urwid.Button, urwid.CheckBox)):
+                if widget.get_label() != text:
+                    widget.set_label(text)
+            elif text is not None and widget.get_text() != text:
+                widget.set_text(text_markup(*text))
+            for _ in WidgetMeta.HANDLERS:
+                if _ in handlers or widget_meta(widget, _):
+                    set_widget_meta(widget, _, handlers.get(_))
+        for name, text in (texts or {}).items():
+            widget = getattr(self.widgets, name)
+            if isinstance(widget, urwid.Edit):
+                widget.set_edit_text(text)
+            elif isinstance(widget, (urwid.Button, urwid.CheckBox)):
+                widget.set_label(text)
+            else:
+                widget.set_text(text)
+        self._data.clear()
+        self._data.update(data or {})
+        while self._handlers:
+            self.popHandler()
+        self._startCallback = idem
+        self._endCallback = idem
+        if len(self._listbox.body):
+            self._listbox.set_focus(0)
+        return self
 
     def onStart(self, callback):
         """Registers the callback that will be triggered on dialog start."""
@@ -1309,13 +5198,32 @@ class Dialog(UI):
         """Registers the callback that will be triggered on dialog end."""
         self._endCallback = callback
 
+    def after(self, delay, callback, *args):
+        """Dialogs use the timers of their parent (see 'UI.after')."""
+        return self._parent.after(delay, callback, *args)
+
+    def cancel(self, timer):
+        return self._parent.cancel(timer)
+
+    def getFocused(self):
+        """Gets the focused widget of the dialog"""
+        return focused_widget(self._listbox.get_focus()[0])
+
+    def render(self, size):
+        return self.view().render(size, focus=True)
+
     def doKeyPress(self, widget, key):
-        self._handle("keyPress", widget, key)
+        if self._doBinding(widget, key, self.isEditable(self.getFocused())):
+            return True
+        responder = self._lookup("keyPress")
+        return responder(widget, key) != FORWARD if responder else False
 
     def end(self):
         """Call this to close the dialog."""
         self._endCallback(self)
-        self._parent._dialog = None
+        self._parent.popDialog(self)
+        if self._pool:
+            self._pool.release(self)
 
     def _parseHdr(self, data):
         if self._header != None:
@@ -1328,6 +5236,84 @@ class Dialog(UI):
         )
 
 
+class DialogPool:
+    """Keeps the dialogs built for a console, keyed by template (the UI
+    description and the dialog options), so that opening a dialog again
+    only resets its widgets instead of parsing and building it.
+
+    >   pool = DialogPool(console)
+    >   dialog = pool.open(CONFIRM_UI, texts={"txt_message": "Delete ?"},
+    >                      press={"btn_ok": onDelete})
+
+    Dialogs return to the pool when they 'end'. The pool keeps at most
+    'size' idle dialogs, evicting the least recently used ones."""
+
+    def __init__(self, parent, size=16):
+        self._parent = parent
+        self._size = size
+        self._count = 0
+        self._idle = collections.OrderedDict()
+
+    def open(
+        self,
+        ui,
+        width: int = 40,
+        height: int = -1,
+        style: str = "dialog",
+        header: str = "",
+        palette: str = "",
+        texts=None,
+        press=None,
+        data=None,
+        handler=None,
+        show=True,
+    ):
+        """Returns a dialog for the given template (see 'Dialog.__init__'),
+        taken from the pool or created. The dialog is 'reset' with the given
+        'texts' and 'data', the 'press' callbacks are bound to the widgets
+        with the given ids, the 'handler' is set and the dialog is shown on
+        the parent console unless 'show' is 'False'."""
+        key = (ui, width, height, style, header, palette)
+        idle = self._idle.get(key)
+        if idle:
+            dialog = idle.pop()
+            self._count -= 1
+            if not idle:
+                del self._idle[key]
+            self._parent.stats.count("dialogs.hit")
+        else:
+            dialog = Dialog(self._parent, ui, width, height, style, header, palette)
+            dialog._pool = self
+            dialog._template = key
+            self._parent.stats.count("dialogs.miss")
+        dialog.reset(texts, data)
+        for name, callback in (press or {}).items():
+            dialog.onPress(getattr(dialog.widgets, name), callback)
+        if handler:
+            dialog.handler(handler)
+        if show:
+            self._parent.dialog(dialog)
+        return dialog
+
+    def release(self, dialog):
+        """Returns the given dialog to the pool, evicting the least recently
+        used dialogs if the pool is full."""
+        self._idle.setdefault(dialog._template, []).append(dialog)
+        self._idle.move_to_end(dialog._template)
+        self._count += 1
+        while self._count > self._size:
+            key, idle = next(iter(self._idle.items()))
+            idle.pop(0)
+            self._count -= 1
+            if not idle:
+                del self._idle[key]
+
+    def clear(self):
+        """Removes all the idle dialogs from the pool."""
+        self._idle.clear()
+        self._count = 0
+
+
 # ------------------------------------------------------------------------------
 #
 # HANDLER CLASS
@@ -1345,9 +5331,46 @@ class Handler:
     For instance, you could have a handler for your UI in "normal mode", and
     have another handler when a dialog box is displayed."""
 
+    # Maps event names ('keyPress' and 'KeyPress') to the name of the method
+    # that responds to them ('onKeyPress'), see '__init_subclass__'.
+    DISPATCH = {}
+    _responders = None
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        dispatch = {}
+        for name in dir(cls):
+            if len(name) > 2 and name.startswith("on") and name[2].isupper():
+                event = name[2:]
+                dispatch[event] = name
+                dispatch[event[0].lower() + event[1:]] = name
+        cls.DISPATCH = dispatch
+
     def __init__(self):
         self.ui = None
 
+    def __setattr__(self, name, value):
+        # Responders assigned to the instance replace the cached ones
+        if name.startswith("on"):
+            object.__setattr__(self, "_responders", None)
+        object.__setattr__(self, name, value)
+
+    def lookup(self, event):
+        """Returns the bound method that responds to the given event, or
+        'None'. Responders are resolved once per event and cached."""
+        responders = self._responders
+        if responders is None:
+            responders = {}
+            object.__setattr__(self, "_responders", responders)
+        elif event in responders:
+            return responders[event]
+        name = self.DISPATCH.get(event)
+        if name is None and event:
+            # The responder may have been assigned to the instance
+            name = "on" + event[0].upper() + event[1:]
+        res = responders[event] = getattr(self, name, None) if name else None
+        return res
+
     def respond(self, event, *args, **kwargs):
         """Responds to the given event name. An exception must be raised if the
         event cannot be responded to. False is returned if the handler does not
@@ -1357,20 +5380,18 @@ class Handler:
 
     def responds(self, event):
         """Tells if the handler responds to the given event."""
-        name = "on" + event[0].upper() + event[1:]
-        if hasattr(self, name):
-            return name
-        else:
-            return None
+        return self.DISPATCH.get(event) or (
+            "on" + event[0].upper() + event[1:] if self.lookup(event) else None
+        )
 
     def responder(self, event):
         """Returns the function that responds to the given event."""
+        res = self.lookup(event)
+        if res:
+            return res
         name = "on" + event[0].upper() + event[1:]
         if hasattr(self, name):
-            res = getattr(self, name)
-            if not res:
-                raise UIRuntimeError(f"Event handler assigned to None: {name}")
-            return res
+            raise UIRuntimeError(f"Event handler assigned to None: {name}")
         else:
             raise UIRuntimeError("Event not implemented: " + event)
 
@@ -0,0 +1,143 @@
+#!/usr/bin/env python
+# encoding: utf8
+# -----------------------------------------------------------------------------
+# Project   : URWIDE - Extended URWID
+# -----------------------------------------------------------------------------
+# License   : Lesser GNU Public License  http://www.gnu.org/licenses/lgpl.html>
+# -----------------------------------------------------------------------------
+
+"""Time budgets for importing 'urwide' and for the first frame of a long UI,
+which fail when the startup regresses. Run with 'python -m pytest tests' or
+'python -m unittest discover tests'."""
+
+import os, sys, re, time, subprocess, unittest
+
+SOURCES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src", "py")
+sys.path.insert(0, SOURCES)
+import urwide
+
+# The time (in seconds) spent in the body of the 'urwide' module, without the
+# modules it imports (which are mostly 'urwid')
+IMPORT_BUDGET = 0.04
+# The time (in seconds) to import 'urwide' and the modules it imports, without
+# 'urwid', which catches heavy dependencies that are imported right away
+DEPENDENCIES_BUDGET = 0.15
+# The time (in seconds) to create the long UI and render its first frame
+FRAME_BUDGET = 0.25
+# The modules that are only imported by the backends (or widgets) that use
+# them
+DEFERRED_MODULES = (
+    "curses",
+    "gzip",
+    "http.server",
+    "urwid.curses_display",
+    "numpy",
+)
+
+RE_IMPORT = re.compile(r"import time:\s*(\d+) \|\s*(\d+) \|( *)(\S+)")
+
+
+def long_ui(boxes=800):
+    """Returns a UI text with a header and the given number of boxes, each
+    with a pile of edits, choices and a button."""
+    res = ["Hdr Report"]
+    for i in range(10):
+        res.append("Txt Line %d" % (i))
+    for i in range(boxes):
+        res.extend(
+            (
+                "Box border=1",
+                " Ple",
+                "  Txt Section %d" % (i),
+                "  Col",
+                "   Edt Name: [x%d] #name%d" % (i, i),
+                "   Chc [ :g%d] A" % (i),
+                "   Chc [X:g%d] B" % (i),
+                "  End",
+                "  Btn [Go %d] &press=go" % (i),
+                " End",
+                "End",
+            )
+        )
+    return "\n".join(res) + "\n"
+
+
+def tail_ui(lines):
+    """Returns a UI text with the given number of texts with ids."""
+    return "".join("Txt Tail %d args:#tail%d\n" % (i, i) for i in range(lines))
+
+
+def import_times():
+    """Imports 'urwide' in a new interpreter and returns the '-X importtime'
+    entries as a dict of module name to '(self, cumulative)' seconds. The
+    first run compiles the module, so that the bytecode is not measured."""
+    env = dict(os.environ, PYTHONPATH=SOURCES)
+    env.pop("PYTHONDONTWRITEBYTECODE", None)
+    command = [sys.executable, "-X", "importtime", "-c", "import urwide"]
+    for _ in range(2):
+        out = subprocess.run(command, env=env, capture_output=True, text=True)
+    res = {}
+    for line in out.stderr.split("\n"):
+        match = RE_IMPORT.match(line)
+        if match:
+            res[match.group(4)] = (
+                int(match.group(1)) / 1e6,
+                int(match.group(2)) / 1e6,
+            )
+    return res
+
+
+def first_frame(text, progressive=False):
+    """Creates a console with the given UI text and returns the time taken
+    to create it and to render its first frame, with the frame."""
+    started = time.perf_counter()
+    console = urwide.Console()
+    console.progressive(progressive)
+    console.create("", text)
+    frame = console.snapshot(80, 24)
+    return time.perf_counter() - started, frame
+
+
+class Budgets(unittest.TestCase):
+    def testImport(self):
+        # The best of a few runs, so that a busy machine does not fail it
+        runs = [import_times() for _ in range(3)]
+        times = min(runs, key=lambda _: _["urwide"][0])
+        self.assertLess(times["urwide"][0], IMPORT_BUDGET)
+        dependencies = min(_["urwide"][1] - _["urwid"][1] for _ in runs)
+        self.assertLess(dependencies, DEPENDENCIES_BUDGET)
+        for name in DEFERRED_MODULES:
+            self.assertFalse(name in times, "imported with urwide: " + name)
+
+    def testFirstFrame(self):
+        text = long_ui()
+        elapsed = min(first_frame(text)[0] for _ in range(3))
+        self.assertLess(elapsed, FRAME_BUDGET)
+
+    def testProgressive(self):
+        text = long_ui() + tail_ui(2000)
+        elapsed, frame = first_frame(text, progressive=True)
+        self.assertLess(elapsed, FRAME_BUDGET)
+        self.assertEqual(frame, first_frame(text)[1])
+
+    def testProgressiveIdentical(self):
+        # The progressively built UI renders the same as the eager one, all
+        # along (the render is taller than the whole UI)
+        text = long_ui(40) + tail_ui(200)
+        eager = urwide.Console()
+        eager.create("", text)
+        console = urwide.Console()
+        console.progressive(True)
+        console.create("", text)
+        self.assertFalse(console.isBuilt())
+        # Looking up an id builds the widget that defines it
+        self.assertEqual(console.widgets.name30.get_edit_text(), "x30")
+        while not console.isBuilt():
+            console._runTimers()
+        self.assertEqual(console.snapshot(80, 1000), eager.snapshot(80, 1000))
+
+
+if __name__ == "__main__":
+    unittest.main()
+
+# EOF
@@ -0,0 +1,54 @@
+#!/usr/bin/env python
+# encoding: utf8
+# -----------------------------------------------------------------------------
+# Project   : URWIDE - Extended URWID
+# -----------------------------------------------------------------------------
+# License   : Lesser GNU Public License  http://www.gnu.org/licenses/lgpl.html>
+# -----------------------------------------------------------------------------
+
+"""Tests the dialogs reused from a 'DialogPool', which must open as they were
+right after being made."""
+
+import os, sys, unittest
+
+SOURCES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src", "py")
+sys.path.insert(0, SOURCES)
+import urwide
+
+FORM = """\
+Ple
+ Edt [x] #name
+ Btn [Hello] #greet
+End
+"""
+
+
+class PooledDialogs(unittest.TestCase):
+    def setUp(self):
+        self.console = urwide.Console().create("", "Txt Console\n", urwide.Handler())
+        self.pool = urwide.DialogPool(self.console)
+
+    def assertResets(self, text):
+        dialog = self.pool.open(text)
+        dialog.widgets.name.set_edit_text("secret")
+        dialog.widgets.greet.set_label("changed")
+        dialog.end()
+        reopened = self.pool.open(text)
+        self.assertIs(reopened, dialog)
+        self.assertEqual(dialog.widgets.name.get_edit_text(), "x")
+        self.assertEqual(dialog.widgets.greet.get_label(), "Hello")
+
+    def testReset(self):
+        self.assertResets(FORM)
+
+    def testResetLong(self):
+        # A dialog longer than 'DEFER_AFTER' is built whole, so that all its
+        # widgets are saved
+        lines = "".join("Txt Line %d\n" % (i) for i in range(urwide.UI.DEFER_AFTER + 6))
+        self.assertResets(lines + FORM)
+
+
+if __name__ == "__main__":
+    unittest.main()
+
+# EOF
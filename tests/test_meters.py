@@ -0,0 +1,47 @@
+#!/usr/bin/env python
+# encoding: utf8
+# -----------------------------------------------------------------------------
+# Project   : URWIDE - Extended URWID
+# -----------------------------------------------------------------------------
+# License   : Lesser GNU Public License  http://www.gnu.org/licenses/lgpl.html>
+# -----------------------------------------------------------------------------
+
+"""Tests the refresh of the meters ('Prg', 'Gge' and 'Spk')."""
+
+import os, sys, time, unittest
+
+SOURCES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src", "py")
+sys.path.insert(0, SOURCES)
+import urwide
+
+UI = """\
+Gge #cpu label="CPU", value_format="%.0f%%"
+Spk #rps label="Req/s"
+"""
+
+
+class Meters(unittest.TestCase):
+    def setUp(self):
+        self.console = urwide.Console().create("", UI, urwide.Handler())
+
+    def testIdle(self):
+        # Meters with no new samples do not wake the loop up
+        self.assertEqual(self.console._timerWait(), None)
+
+    def testRefresh(self):
+        console = self.console
+        for i in range(100):
+            console.widgets.cpu.series.append(i)
+            console.widgets.rps.series.append(i)
+        # A single refresh is scheduled, however many samples come
+        self.assertEqual(len([_ for _ in console._timers if _[2]]), 1)
+        time.sleep(console.METER_DELAY)
+        console._runTimers()
+        self.assertIn("99%", console.snapshot(40, 2))
+        self.assertEqual(console._timerWait(), None)
+
+
+if __name__ == "__main__":
+    unittest.main()
+
+# EOF
@@ -0,0 +1,56 @@
+#!/usr/bin/env python
+# encoding: utf8
+# -----------------------------------------------------------------------------
+# Project   : URWIDE - Extended URWID
+# -----------------------------------------------------------------------------
+# License   : Lesser GNU Public License  http://www.gnu.org/licenses/lgpl.html>
+# -----------------------------------------------------------------------------
+
+"""Tests the 'Grd' tile grids (see 'TileGrid')."""
+
+import os, sys, unittest
+
+SOURCES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src", "py")
+sys.path.insert(0, SOURCES)
+import urwide
+
+
+class Handler(urwide.Handler):
+    def __init__(self):
+        urwide.Handler.__init__(self)
+        self.pressed = []
+
+    def onOpen(self, grid, index):
+        self.pressed.append(index)
+
+
+class TileGrids(unittest.TestCase):
+    def create(self, text):
+        self.handler = Handler()
+        self.console = urwide.Console().create("", text, self.handler)
+        return self.console.widgets.grid
+
+    def testPress(self):
+        grid = self.create("Grd #grid &press=open items=[1,2,3]\n")
+        grid.keypress((30, 5), "right")
+        self.assertEqual(grid.keypress((30, 5), "enter"), None)
+        self.assertEqual(self.handler.pressed, [1])
+
+    def testNoPress(self):
+        # Without a press event, enter does nothing
+        grid = self.create("Grd #grid items=[1,2,3]\n")
+        grid.keypress((30, 5), "enter")
+        grid.keypress((30, 5), " ")
+        self.assertEqual(self.handler.pressed, [])
+
+    def testOnPress(self):
+        grid = self.create("Grd #grid items=[1,2,3]\n")
+        self.console.onPress(grid, self.handler.onOpen)
+        grid.keypress((30, 5), "enter")
+        self.assertEqual(self.handler.pressed, [0])
+
+
+if __name__ == "__main__":
+    unittest.main()
+
+# EOF
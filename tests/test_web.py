@@ -0,0 +1,48 @@
+#!/usr/bin/env python
+# encoding: utf8
+# -----------------------------------------------------------------------------
+# Project   : URWIDE - Extended URWID
+# -----------------------------------------------------------------------------
+# License   : Lesser GNU Public License  http://www.gnu.org/licenses/lgpl.html>
+# -----------------------------------------------------------------------------
+
+"""Tests the screen diffs sent by the 'WebScreen'."""
+
+import os, sys, unittest
+
+SOURCES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src", "py")
+sys.path.insert(0, SOURCES)
+import urwide
+
+
+class Canvas:
+    """A canvas with the given rows of '(attr, charset, bytes)' segments."""
+
+    def __init__(self, *rows):
+        self.rows = rows
+
+    def content(self):
+        return iter(self.rows)
+
+
+class WebScreenDiff(unittest.TestCase):
+    def setUp(self):
+        self.screen = urwide.WebScreen(urwide.LoopbackTransport())
+        self.screen.diff(Canvas([(None, None, b"abc")]))
+
+    def testChanged(self):
+        updates = self.screen.diff(Canvas([(None, None, b"abd")]))
+        self.assertEqual(len(updates), 1)
+        self.assertEqual(updates[0][:2], [0, 2])
+
+    def testResegmented(self):
+        # The same cells in other segments are not sent again
+        row = [(None, None, b"a"), (None, None, b"bc")]
+        self.assertEqual(self.screen.diff(Canvas(row)), [])
+        self.assertEqual(self.screen.diff(Canvas(row)), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
+
+# EOF